@@ -1,27 +1,78 @@
 #!/usr/bin/env python
 
 import argparse
-from typing import Self
+import glob
+import io
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Self, TextIO
 from pathlib import Path
+# modules shared by the toolchain, like the cache, live in projects/common
+sys.path.append(str(Path(__file__).resolve().parents[2] / "common"))
 from parser import Parser
 from codewriter import CodeWriter
 from table import Table
+from toolcache import Cache
+from optimizer import PeepholeOptimizer
+from sourcemap import SourceMap
 
 class HackAssembler:
-    def __init__(self: Self, path: Path):
+    def __init__(
+        self: Self,
+        path: Path,
+        two_pass: bool = False,
+        packed: bool = False,
+        cache: Cache | None = None,
+        optimize: bool = False,
+        source_map: bool = False
+    ):
         self._input_path = path.resolve()
+        self._two_pass = two_pass
+        self._packed = packed
+        self._optimize = optimize
+        self._cache = cache
         self._output_path = self._get_output_path()
-        self._input_stream = open(self._input_path)
-        self._output_stream = open(self._output_path, "w")
-        self._parser = Parser(self._input_stream)
-        self._code = CodeWriter(self._output_stream)
+        self._binary_output_path = self._get_binary_output_path()
+        self._map_output_path = self._get_map_output_path()
         self._table = Table()
+        self._source_map = SourceMap() if source_map else None
 
     def assemble(self: Self) -> None:
-        self._mark_labels()
-        self._parser.reset()
-        self._assemble()
-        self._close_streams()
+        output_paths = [self._output_path]
+        if self._packed:
+            output_paths.append(self._binary_output_path)
+        if self._source_map:
+            output_paths.append(self._map_output_path)
+
+        if self._cache:
+            key = self._cache.get_key(
+                [self._input_path],
+                "packed" if self._packed else "text",
+                "optimize" if self._optimize else "plain",
+                "map" if self._source_map else "nomap"
+            )
+            if self._cache.restore(key, output_paths):
+                return
+
+        self._open_streams()
+        try:
+            if self._two_pass:
+                self._mark_labels()
+                self._parser.reset()
+                self._assemble()
+            else:
+                self._assemble_single_pass()
+        finally:
+            self._close_streams()
+
+        if self._source_map:
+            with open(self._map_output_path, "w") as stream:
+                self._source_map.write(stream)
+
+        if self._cache:
+            self._cache.store(key, output_paths)
 
     def _mark_labels(self: Self) -> None:
         line_number = 0
@@ -35,17 +86,24 @@ class HackAssembler:
             else:
                 symbol = parser.get_symbol()
                 self._table.add_entry(symbol, line_number)
+                if self._source_map:
+                    self._source_map.add_label(symbol, line_number)
 
     def _assemble(self: Self) -> None:
         parser = self._parser
         code = self._code
         table = self._table
+        source_map = self._source_map
 
         while parser.has_more_lines():
             parser.advance()
 
             if parser.is_label():
                 continue
+            if source_map:
+                source_map.add_instruction(
+                    parser.get_line_number(), parser.get_source()
+                )
             if parser.is_address():
                 symbol = parser.get_symbol()
                 is_num = symbol.isnumeric()
@@ -61,35 +119,296 @@ class HackAssembler:
                 jump = parser.get_jump()
                 code.write_computation(dest, comp, jump)
 
+    def _assemble_single_pass(self: Self) -> None:
+        words = assemble(self._input_stream, self._table, self._source_map)
+        for word in words:
+            self._code.write_word(word)
+
+    def _open_streams(self: Self) -> None:
+        self._input_stream = open(self._input_path)
+        if self._optimize:
+            self._input_stream = self._optimize_stream(self._input_stream)
+        self._output_stream = open(self._output_path, "w")
+        self._binary_stream = (
+            open(self._binary_output_path, "wb") if self._packed else None
+        )
+        self._parser = Parser(self._input_stream)
+        self._code = CodeWriter(self._output_stream, self._binary_stream)
+
+    def _optimize_stream(self: Self, stream: TextIO) -> TextIO:
+        optimizer = PeepholeOptimizer(stream)
+        lines = optimizer.optimize()
+        stream.close()
+
+        before, after = optimizer.get_instruction_counts()
+        print(
+            f"Optimized '{self._input_path.name}': "
+            f"{before} -> {after} instructions ({after - before:+})",
+            file=sys.stderr
+        )
+
+        return io.StringIO("\n".join(lines))
+
     def _close_streams(self: Self) -> None:
         self._input_stream.close()
         self._output_stream.close()
+        if self._binary_stream:
+            self._binary_stream.close()
 
     def _get_output_path(self: Self) -> Path:
         return self._input_path.with_suffix(".hack")
 
-def validate_path(path_str: str) -> Path:
+    def _get_binary_output_path(self: Self) -> Path:
+        return self._input_path.with_suffix(".hackb")
+
+    def _get_map_output_path(self: Self) -> Path:
+        return self._input_path.with_suffix(".map")
+
+def assemble(
+    source: str | Iterable[str],
+    table: Table | None = None,
+    source_map: SourceMap | None = None
+) -> array:
+    """Assemble Hack source in memory and return the program as 16-bit words.
+
+    `source` is either the whole program text or an iterable of its lines.
+    Labels and variables are recorded in `table` when one is passed, so the
+    caller can inspect the resolved symbols afterwards. Passing `source_map`
+    records the labels and source lines of every ROM address.
+    """
+
+    if isinstance(source, str):
+        source = source.splitlines()
+
+    parser = Parser(source)
+    table = table if table is not None else Table()
+    instructions = array("H")
+    fixups: list[tuple[int, str]] = [] # (instruction index, symbol)
+
+    while parser.has_more_lines():
+        parser.advance()
+
+        if parser.is_label():
+            symbol = parser.get_symbol()
+            table.add_entry(symbol, len(instructions))
+            if source_map:
+                source_map.add_label(symbol, len(instructions))
+            continue
+
+        if source_map:
+            source_map.add_instruction(
+                parser.get_line_number(), parser.get_source()
+            )
+
+        if parser.is_address():
+            symbol = parser.get_symbol()
+
+            if symbol.isnumeric():
+                instructions.append(int(symbol))
+            elif table.contains(symbol):
+                instructions.append(table.get_address(symbol))
+            else:
+                # forward label reference or variable, resolved at the end
+                fixups.append((len(instructions), symbol))
+                instructions.append(0)
+        else:
+            dest = parser.get_dest()
+            comp = parser.get_comp()
+            jump = parser.get_jump()
+            instructions.append(CodeWriter.code_computation(dest, comp, jump))
+
+    # symbols still unknown after the whole file are variables and get
+    # allocated in order of first reference, same as in the two-pass mode
+    for index, symbol in fixups:
+        if not table.contains(symbol):
+            table.add_entry(symbol)
+        instructions[index] = table.get_address(symbol)
+
+    return instructions
+
+def assemble_stream(
+    input_stream: TextIO,
+    output_stream: TextIO,
+    packed: bool = False,
+    optimize: bool = False
+) -> None:
+    source = input_stream
+    if optimize:
+        source = PeepholeOptimizer(input_stream).optimize()
+
+    # labels may be referenced before they are defined, so the words can
+    # only be written once the whole input has been read, but the input
+    # itself is consumed line by line and kept as packed words
+    words = assemble(source)
+
+    if packed:
+        if sys.byteorder == "big":
+            words.byteswap()
+        output_stream.buffer.write(words.tobytes())
+    else:
+        code = CodeWriter(output_stream)
+        for word in words:
+            code.write_word(word)
+
+    output_stream.flush()
+
+def assemble_files(
+    paths: list[Path],
+    jobs: int | None = None,
+    two_pass: bool = False,
+    packed: bool = False,
+    cache: Cache | None = None,
+    optimize: bool = False,
+    source_map: bool = False
+) -> int:
+    failures = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [
+            executor.submit(
+                _assemble_file,
+                path, two_pass, packed, cache, optimize, source_map
+            )
+            for path in paths
+        ]
+
+        for path, future in zip(paths, futures):
+            try:
+                elapsed = future.result()
+                print(f"{path}: {elapsed:.3f}s")
+            except Exception as e:
+                failures += 1
+                print(f"{path}: error: {type(e).__name__}: {e}")
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Assembled {len(paths) - failures} of {len(paths)} files "
+        f"in {elapsed:.3f}s, {failures} failed"
+    )
+    return failures
+
+def _assemble_file(
+    path: Path,
+    two_pass: bool,
+    packed: bool,
+    cache: Cache | None,
+    optimize: bool,
+    source_map: bool
+) -> float:
+    start = time.perf_counter()
+    HackAssembler(
+        path, two_pass, packed, cache, optimize, source_map
+    ).assemble()
+    return time.perf_counter() - start
+
+STDIN = Path("-")
+
+def validate_path(path_str: str) -> list[Path]:
     path_suffix = ".asm"
     path = Path(path_str)
 
+    if path == STDIN:
+        return [path]
+
+    if glob.has_magic(path_str):
+        paths = [Path(p) for p in sorted(glob.glob(path_str))]
+        paths = [p for p in paths if p.is_file() and p.suffix == path_suffix]
+        if not paths:
+            raise argparse.ArgumentTypeError(
+                f"pattern '{path_str}' matches no '{path_suffix}' files"
+            )
+        return paths
+
     if not path.exists():
         raise argparse.ArgumentTypeError(f"file '{path}' does not exist")
-    if not path.is_file():
-        raise argparse.ArgumentTypeError(f"'{path}' is not a file")
+    if path.is_dir():
+        paths = sorted(path.glob(f"*{path_suffix}"))
+        if not paths:
+            raise argparse.ArgumentTypeError(
+                f"directory '{path}' contains no '{path_suffix}' files"
+            )
+        return paths
     if path.suffix != path_suffix:
         raise argparse.ArgumentTypeError(
             f"file extension must be '{path_suffix}', but got '{path.suffix}'"
         )
 
-    return path
+    return [path]
+
+def validate_jobs(jobs_str: str) -> int:
+    jobs = int(jobs_str)
+    if jobs < 1:
+        raise argparse.ArgumentTypeError(f"expected at least 1 job, got {jobs}")
+    return jobs
 
 def main():
     parser = argparse.ArgumentParser(
         description="Translate Hack Assembly code to Binary instructions."
     )
-    parser.add_argument("path", type=validate_path, help="Path to .asm file")
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        type=validate_path,
+        help="Path to .asm file, directory of .asm files or glob pattern, "
+             "'-' to read from standard input and write to standard output"
+    )
+    parser.add_argument(
+        "--two-pass",
+        action="store_true",
+        help="resolve labels in a separate pass that re-reads the file"
+    )
+    parser.add_argument(
+        "--packed",
+        action="store_true",
+        help="also write a .hackb file of little-endian 16-bit words "
+             "(only the packed words when writing to standard output)"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=validate_jobs,
+        default=None,
+        help="number of worker processes (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always assemble, even when a cached output is available"
+    )
+    parser.add_argument(
+        "-O", "--optimize",
+        action="store_true",
+        help="run the peephole optimizer before labels are resolved"
+    )
+    parser.add_argument(
+        "--map",
+        action="store_true",
+        help="also write a .map file with the labels and source lines of "
+             "every ROM address"
+    )
     args = parser.parse_args()
-    HackAssembler(args.path).assemble()
+    if args.map and args.optimize:
+        parser.error("--map cannot be combined with --optimize")
+
+    if any(STDIN in ps for ps in args.paths):
+        if len(args.paths) > 1 or args.two_pass or args.map:
+            parser.error(
+                "'-' cannot be combined with other paths, --two-pass or --map"
+            )
+        assemble_stream(sys.stdin, sys.stdout, args.packed, args.optimize)
+        return
+
+    paths = list(dict.fromkeys(p.resolve() for ps in args.paths for p in ps))
+    cache = (
+        None if args.no_cache
+        else Cache("assembler", Path(__file__).parent)
+    )
+    options = (args.two_pass, args.packed, cache, args.optimize, args.map)
+
+    if len(paths) == 1:
+        HackAssembler(paths[0], *options).assemble()
+    elif assemble_files(paths, args.jobs, *options):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+import argparse
+import io
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+# modules shared by the toolchain, like the encoding, live in projects/common
+sys.path.append(str(Path(__file__).resolve().parents[2] / "common"))
+from parser import Parser
+from codewriter import CodeWriter
+from table import Table
+from assembler import HackAssembler, assemble
+
+def generate(n_lines: int, seed: int = 0) -> list[list[str]]:
+    # the corpus is split into programs that still fit into the 32K ROM,
+    # otherwise label addresses would not fit into an A-instruction
+    rng = random.Random(seed)
+    programs = []
+
+    while n_lines > 0:
+        size = min(n_lines, _PROGRAM_LINES)
+        programs.append(_generate_program(size, rng))
+        n_lines -= size
+
+    return programs
+
+def _generate_program(n_lines: int, rng: random.Random) -> list[str]:
+    # mix of hand written code in the style of projects/04 and VM translator
+    # output: comment banners, push/pop through SP and R13, comparison
+    # labels, call/return labels, user variables and forward jumps
+    lines = ["// Synthetic Hack assembly benchmark program", ""]
+    label_index = 0
+    variables = [f"var{i}" for i in range(200)]
+    pending_labels = []
+
+    while len(lines) < n_lines:
+        block = rng.random()
+
+        if pending_labels and rng.random() < 0.3:
+            lines.append(f"({pending_labels.pop()})")
+
+        if block < 0.35:
+            n = rng.randrange(32768)
+            lines += [
+                f"// push constant {n}",
+                f"@{n}", "D=A", "@SP", "A=M", "M=D", "@SP", "M=M+1",
+            ]
+        elif block < 0.55:
+            segment = rng.choice(["LCL", "ARG", "THIS", "THAT"])
+            index = rng.randrange(8)
+            lines += [
+                f"// pop {segment.lower()} {index}",
+                f"@{segment}", "D=M", f"@{index}", "A=D+A", "D=A",
+                "@R13", "M=D", "@SP", "AM=M-1", "D=M", "@R13", "A=M", "M=D",
+            ]
+        elif block < 0.65:
+            label = f"COMP_{label_index}"
+            label_index += 1
+            jump = rng.choice(["JEQ", "JLT", "JGT"])
+            lines += [
+                "// comparison",
+                "@SP", "AM=M-1", "D=M", "A=A-1", "D=M-D",
+                f"@{label}_TRUE", f"D;{jump}",
+                "@SP", "A=M-1", "M=0", f"@{label}_END", "0;JMP",
+                f"({label}_TRUE)", "@SP", "A=M-1", "M=-1", f"({label}_END)",
+            ]
+        elif block < 0.75:
+            label = f"Main.f{label_index}$ret.0"
+            label_index += 1
+            lines += [
+                "// call",
+                "// =============================================",
+                "",
+                f"@{label}", "D=A", "@SP", "A=M", "M=D", "@SP", "M=M+1",
+                f"@Main.f{label_index}", "0;JMP", f"({label})", "",
+            ]
+            pending_labels.append(f"Main.f{label_index}")
+        else:
+            variable = rng.choice(variables)
+            label = f"LOOP{label_index}"
+            label_index += 1
+            lines += [
+                f"  // {variable} = {variable} + R0",
+                f"  @{variable}",
+                "  D = M",
+                "  @R0",
+                "  D = D + M",
+                f"  @{variable}",
+                "  M = D",
+                f"  @{label}",
+                "  D;JGT",
+            ]
+            pending_labels.append(label)
+
+    lines += [f"({label})" for label in pending_labels]
+    return lines
+
+def benchmark(programs: list[list[str]]) -> list[tuple[str, float, float]]:
+    results = []
+
+    # parser on its own: classify every line and split C-instructions
+    def parse() -> list[list[tuple]]:
+        return [parse_program(lines) for lines in programs]
+
+    def parse_program(lines: list[str]) -> list[tuple]:
+        parser = Parser(lines)
+        records = []
+        while parser.has_more_lines():
+            parser.advance()
+            if parser.is_label():
+                records.append(("(", parser.get_symbol()))
+            elif parser.is_address():
+                records.append(("@", parser.get_symbol()))
+            else:
+                records.append(
+                    (parser.get_dest(), parser.get_comp(), parser.get_jump())
+                )
+        return records
+
+    programs_records = parse()
+    results.append(("parser", *_measure(parse)))
+
+    # symbol table on its own: replay the lookups of a two-pass assembly
+    def resolve() -> None:
+        for records in programs_records:
+            resolve_program(records)
+
+    def resolve_program(records: list[tuple]) -> list[int]:
+        # returns the address of every A-instruction, in program order
+        table = Table()
+        address = 0
+        for record in records:
+            if record[0] == "(":
+                table.add_entry(record[1], address)
+            else:
+                address += 1
+        addresses = []
+        for record in records:
+            if record[0] != "@":
+                continue
+            if record[1].isnumeric():
+                addresses.append(int(record[1]))
+                continue
+            if not table.contains(record[1]):
+                table.add_entry(record[1])
+            addresses.append(table.get_address(record[1]))
+        return addresses
+
+    results.append(("table", *_measure(resolve)))
+    programs_addresses = [
+        resolve_program(records) for records in programs_records
+    ]
+
+    # code writer on its own: encode and write every instruction, with the
+    # addresses resolved by the table so the words are the assembler's
+    def encode() -> None:
+        for records, addresses in zip(programs_records, programs_addresses):
+            code = CodeWriter(io.StringIO(), io.BytesIO())
+            addresses = iter(addresses)
+            for record in records:
+                if record[0] == "@":
+                    code.write_address(next(addresses))
+                elif record[0] != "(":
+                    code.write_computation(*record)
+
+    def assemble_all() -> None:
+        for lines in programs:
+            assemble(lines)
+
+    results.append(("codewriter", *_measure(encode)))
+    results.append(("assemble()", *_measure(assemble_all)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i, lines in enumerate(programs):
+            path = Path(directory) / f"Benchmark{i}.asm"
+            path.write_text("\n".join(lines) + "\n")
+            paths.append(path)
+
+        for name, two_pass in [("single-pass", False), ("two-pass", True)]:
+            def run() -> None:
+                for path in paths:
+                    HackAssembler(path, two_pass).assemble()
+            results.append((name, *_measure(run)))
+
+    return results
+
+def _measure(function: Callable[[], object]) -> tuple[float, float]:
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+
+    # separate traced run, tracemalloc would distort the timing
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the assembler on synthetic Hack programs."
+    )
+    parser.add_argument(
+        "sizes",
+        nargs="*",
+        type=int,
+        default=[10_000, 100_000, 1_000_000],
+        help="number of source lines of each generated corpus"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the program generator"
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'lines':>9} {'stage':<12} {'time (s)':>9} "
+        f"{'lines/s':>11} {'peak MiB':>9}"
+    )
+    for size in args.sizes:
+        programs = generate(size, args.seed)
+        n_lines = sum(len(lines) for lines in programs)
+        for stage, elapsed, peak in benchmark(programs):
+            print(
+                f"{n_lines:>9} {stage:<12} {elapsed:>9.3f} "
+                f"{n_lines / elapsed:>11,.0f} {peak:>9.1f}"
+            )
+
+_PROGRAM_LINES = 32_000
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+from typing import Iterable, Self, TextIO
+from parser import Parser
+
+# ("@", symbol) | ("(", symbol) | ("C", dest, comp, jump)
+Instruction = tuple[str, ...]
+
+class PeepholeOptimizer:
+    def __init__(self: Self, stream: TextIO | Iterable[str]) -> None:
+        self._parser = Parser(stream)
+        self._count_before = 0
+        self._count_after = 0
+
+    def optimize(self: Self) -> list[str]:
+        instructions: list[Instruction] = []
+        parser = self._parser
+
+        while parser.has_more_lines():
+            parser.advance()
+
+            if parser.is_label():
+                instructions.append(("(", parser.get_symbol()))
+            elif parser.is_address():
+                instructions.append(("@", parser.get_symbol()))
+            else:
+                dest = parser.get_dest() or None
+                comp = parser.get_comp()
+                jump = parser.get_jump() or None
+                instructions.append(("C", dest, comp, jump))
+
+        self._count_before = PeepholeOptimizer._count(instructions)
+        instructions = PeepholeOptimizer._rewrite(instructions)
+        instructions = PeepholeOptimizer._remove_jumps_to_next(instructions)
+        self._count_after = PeepholeOptimizer._count(instructions)
+
+        return [PeepholeOptimizer._format(i) for i in instructions]
+
+    def get_instruction_counts(self: Self) -> tuple[int, int]:
+        return self._count_before, self._count_after
+
+    @staticmethod
+    def _rewrite(instructions: list[Instruction]) -> list[Instruction]:
+        # each instruction is pushed onto the output and the rules are
+        # retried on its tail, so one rewrite can enable the next one
+        out: list[Instruction] = []
+
+        for instruction in instructions:
+            out.append(instruction)
+            while PeepholeOptimizer._apply_rules(out):
+                pass
+
+        return out
+
+    @staticmethod
+    def _apply_rules(out: list[Instruction]) -> bool:
+        # M=M+1 / AM=M-1 -> A=M, the second @SP of a push followed by a
+        # pop is already gone by the time its AM=M-1 arrives
+        if out[-2:] == _PUSH_POP:
+            out[-2:] = _PUSH_POP_REPLACEMENT
+            return True
+
+        last = out[-1]
+
+        if last[0] == "@" and PeepholeOptimizer._get_a_symbol(out) == last[1]:
+            out.pop()
+            return True
+
+        if len(out) < 2 or last[0] != "C" or out[-2][0] != "C":
+            return False
+
+        previous = out[-2]
+
+        if last == previous and PeepholeOptimizer._is_idempotent(last):
+            out.pop()
+            return True
+
+        # M=D / D=M -> M=D
+        if last == ("C", "D", "M", None) and PeepholeOptimizer._stores_d(previous):
+            out.pop()
+            return True
+
+        return False
+
+    @staticmethod
+    def _get_a_symbol(out: list[Instruction]) -> str | None:
+        # symbol A is known to hold before the last instruction is executed
+        for instruction in reversed(out[:-1]):
+            if instruction[0] == "@":
+                return instruction[1]
+            if instruction[0] == "(":
+                return None
+            dest = instruction[1]
+            if dest and "A" in dest:
+                return None
+        return None
+
+    @staticmethod
+    def _is_idempotent(instruction: Instruction) -> bool:
+        _, dest, comp, jump = instruction
+        if jump or not dest:
+            return False
+        reads = set(comp) & {"A", "D", "M"}
+        if "M" in reads:
+            reads.add("A")
+        if "A" in dest and "M" in dest:
+            return False
+        return not reads & set(dest)
+
+    @staticmethod
+    def _stores_d(instruction: Instruction) -> bool:
+        _, dest, comp, jump = instruction
+        if jump or not dest or "A" in dest or "M" not in dest:
+            return False
+        return "D" in dest or comp == "D"
+
+    @staticmethod
+    def _remove_jumps_to_next(instructions: list[Instruction]) -> list[Instruction]:
+        # @L / 0;JMP / (L) -> (L), as long as the code after (L) loads A
+        # before it uses it, since A no longer holds the address of L
+        out: list[Instruction] = []
+        i = 0
+        n = len(instructions)
+
+        while i < n:
+            if i + 2 < n and PeepholeOptimizer._is_jump_to_next(instructions, i):
+                i += 2
+            else:
+                out.append(instructions[i])
+                i += 1
+
+        return out
+
+    @staticmethod
+    def _is_jump_to_next(instructions: list[Instruction], i: int) -> bool:
+        address, jump = instructions[i], instructions[i + 1]
+        if address[0] != "@" or jump[0] != "C" or jump[1] or not jump[3]:
+            return False
+
+        labels = set()
+        j = i + 2
+        while j < len(instructions) and instructions[j][0] == "(":
+            labels.add(instructions[j][1])
+            j += 1
+
+        return (
+            address[1] in labels
+            and (j == len(instructions) or instructions[j][0] == "@")
+        )
+
+    @staticmethod
+    def _count(instructions: list[Instruction]) -> int:
+        return sum(1 for i in instructions if i[0] != "(")
+
+    @staticmethod
+    def _format(instruction: Instruction) -> str:
+        if instruction[0] == "@":
+            return f"@{instruction[1]}"
+        if instruction[0] == "(":
+            return f"({instruction[1]})"
+
+        _, dest, comp, jump = instruction
+        line = f"{dest}={comp}" if dest else comp
+        return f"{line};{jump}" if jump else line
+
+_PUSH_POP = [("C", "M", "M+1", None), ("C", "AM", "M-1", None)]
+
+_PUSH_POP_REPLACEMENT = [("C", "A", "M", None)]
@@ -1,23 +1,30 @@
-from typing import Iterator, Self, TextIO
+from typing import Iterable, Iterator, Self, TextIO
 
 class Parser:
-    def __init__(self: Self, stream: TextIO) -> None:
+    def __init__(self: Self, stream: TextIO | Iterable[str]) -> None:
         self._stream = stream
         self._iterator = self._create_iterator()
         self._line = ""
-        self._next_line = ""
+        self._next_line = ("", 0, None)
+        self._line_number = 0
+        self._source = None
 
     def reset(self: Self) -> None:
         self._stream.seek(0)
         self._iterator = self._create_iterator()
         self._line = ""
-        self._next_line = ""
+        self._next_line = ("", 0, None)
+        self._line_number = 0
+        self._source = None
 
-    def _create_iterator(self: Self) -> Iterator[str]:
-        for line in self._stream:
+    def _create_iterator(self: Self) -> Iterator[tuple[str, int, str | None]]:
+        source = None
+        for line_number, line in enumerate(self._stream, 1):
             cleaned = Parser._clean_line(line)
-            if not Parser._is_empty(cleaned) and not Parser._is_comment(cleaned):
-                yield cleaned
+            if cleaned.startswith(_SOURCE_MARKER):
+                source = line.split("source:", 1)[1].strip()
+            elif not Parser._is_empty(cleaned) and not Parser._is_comment(cleaned):
+                yield cleaned, line_number, source
 
     def has_more_lines(self: Self) -> bool:
         try:
@@ -27,7 +34,14 @@ class Parser:
             return False
 
     def advance(self: Self) -> None:
-        self._line = self._next_line
+        self._line, self._line_number, self._source = self._next_line
+
+    def get_line_number(self: Self) -> int:
+        return self._line_number
+
+    def get_source(self: Self) -> str | None:
+        # text of the last '// source:' marker seen before the current line
+        return self._source
 
     @staticmethod
     def _is_empty(line: str) -> bool:
@@ -74,3 +88,5 @@ class Parser:
             if c in ["=", ";"]:
                 return i
         return -1
+
+_SOURCE_MARKER = "//source:"
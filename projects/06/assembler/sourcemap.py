@@ -0,0 +1,109 @@
+from bisect import bisect_right
+from typing import Self, TextIO
+
+class SourceMap:
+    def __init__(self: Self) -> None:
+        # every section is a list of (start, end, value) ROM address ranges
+        # sorted by start, so a lookup is a binary search over the starts
+        self._labels: list[tuple[int, int, str]] = []
+        self._sources: list[tuple[int, int, str]] = []
+        self._lines: list[tuple[int, int, int]] = [] # value is the first line
+        self._label_ranges: list[tuple[int, int, str]] | None = None
+        self._size = 0
+
+    def add_label(self: Self, name: str, address: int) -> None:
+        self._labels.append((address, address, name))
+        self._label_ranges = None
+
+    def add_instruction(self: Self, line_number: int, source: str | None) -> None:
+        address = self._size
+        self._size += 1
+        self._label_ranges = None
+
+        if self._lines:
+            start, end, first_line = self._lines[-1]
+            if end == address and first_line + address - start == line_number:
+                self._lines[-1] = (start, address + 1, first_line)
+            else:
+                self._lines.append((address, address + 1, line_number))
+        else:
+            self._lines.append((address, address + 1, line_number))
+
+        if source is None:
+            return
+        if self._sources and self._sources[-1][2] == source:
+            start, _, _ = self._sources[-1]
+            self._sources[-1] = (start, address + 1, source)
+        else:
+            self._sources.append((address, address + 1, source))
+
+    def get_label(self: Self, address: int) -> str | None:
+        return SourceMap._lookup(self._get_label_ranges(), address)
+
+    def get_line_number(self: Self, address: int) -> int | None:
+        entry = SourceMap._find(self._lines, address)
+        if entry is None:
+            return None
+        start, _, first_line = entry
+        return first_line + address - start
+
+    def get_source(self: Self, address: int) -> str | None:
+        return SourceMap._lookup(self._sources, address)
+
+    def write(self: Self, stream: TextIO) -> None:
+        for section, entries in [
+            ("labels", self._get_label_ranges()),
+            ("sources", self._sources),
+            ("lines", self._lines)
+        ]:
+            stream.write(f"{section} {len(entries)}\n")
+            for start, end, value in entries:
+                stream.write(f"{start} {end} {value}\n")
+
+    @staticmethod
+    def read(stream: TextIO) -> "SourceMap":
+        source_map = SourceMap()
+        sections = {
+            "labels": source_map._labels,
+            "sources": source_map._sources,
+            "lines": source_map._lines
+        }
+
+        for header in stream:
+            section, count = header.split()
+            entries = sections[section]
+            for _ in range(int(count)):
+                start, end, value = next(stream).rstrip("\n").split(" ", 2)
+                value = int(value) if section == "lines" else value
+                entries.append((int(start), int(end), value))
+
+        if source_map._lines:
+            source_map._size = source_map._lines[-1][1]
+        return source_map
+
+    def _get_label_ranges(self: Self) -> list[tuple[int, int, str]]:
+        if self._label_ranges is not None:
+            return self._label_ranges
+
+        # a label covers the addresses up to the next label placed further on
+        labels = sorted(self._labels, key=lambda label: label[0])
+        starts = sorted({start for start, _, _ in labels})
+        ends = dict(zip(starts, starts[1:] + [self._size]))
+        self._label_ranges = [
+            (start, max(end, ends[start]), name) for start, end, name in labels
+        ]
+        return self._label_ranges
+
+    @staticmethod
+    def _lookup(entries: list[tuple[int, int, str]], address: int) -> str | None:
+        entry = SourceMap._find(entries, address)
+        return entry[2] if entry else None
+
+    @staticmethod
+    def _find(
+        entries: list[tuple[int, int, str | int]], address: int
+    ) -> tuple[int, int, str | int] | None:
+        i = bisect_right(entries, address, key=lambda entry: entry[0]) - 1
+        if i >= 0 and address < entries[i][1]:
+            return entries[i]
+        return None
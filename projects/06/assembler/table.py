@@ -1,8 +1,9 @@
 from typing import Self
+from hackcode import PREDEFINED_SYMBOLS
 
 class Table:
     def __init__(self: Self) -> None:
-        self._table = Table._create_table()
+        self._table = dict(PREDEFINED_SYMBOLS)
         self._address = 16
 
     def add_entry(self: Self, symbol: str, value: int | None = None) -> None:
@@ -17,14 +18,5 @@ class Table:
     def get_address(self: Self, symbol: str) -> int:
         return self._table[symbol]
 
-    @staticmethod
-    def _create_table() -> dict[str, int]:
-        table = dict([(f"R{i}", i) for i in range(16)])
-        table["SP"] = 0
-        table["LCL"] = 1
-        table["ARG"] = 2
-        table["THIS"] = 3
-        table["THAT"] = 4
-        table["SCREEN"] = 16384
-        table["KBD"] = 24576
-        return table
+    def get_symbols(self: Self) -> dict[str, int]:
+        return dict(self._table)
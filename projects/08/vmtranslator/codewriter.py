@@ -1,5 +1,6 @@
 from pathlib import Path
-from typing import Self
+from typing import Self, TextIO
+from machinewriter import MachineWriter
 
 class CodeWriter:
     SEGMENT_MAP = {
@@ -10,21 +11,83 @@ class CodeWriter:
         "pointer": 3,
         "temp": 5
     }
-
-    def __init__(self: Self, path: Path) -> None:
-        self._stream = open(path, "w")
+    # indices up to which a segment entry is reached by stepping A from
+    # the base (A=M+1, A=A+1), which leaves D free; for a load it is only
+    # shorter than adding the index up to 2, for a store it is shorter
+    # than going through R13 up to 7
+    LOAD_CHAIN = 2
+    STORE_CHAIN = 7
+
+    def __init__(
+        self: Self,
+        path: Path | TextIO | MachineWriter,
+        shared_calls: bool = False,
+        shared_comparisons: bool = False,
+        fuse_comparisons: bool = False,
+        cache_top: bool = False,
+        comments: bool = True,
+        bootstrap: bool = True
+    ) -> None:
+        # machine code is handed over one instruction at a time, without
+        # comments, instead of as text
+        self._machine = path if isinstance(path, MachineWriter) else None
+        self._comments = comments and self._machine is None
+        self._owns_stream = isinstance(path, Path)
+        self._stream = open(path, "w") if isinstance(path, Path) else path
         self._file_name = ""
         self._function_name = ""
         self._label_index = 0
         self._call_index = 0
-        self._bootstrap()
+        # calls and returns jump into routines emitted once by write_end
+        self._shared_calls = shared_calls
+        self._call_arg_counts: set[int] = set()
+        # comparisons jump into one routine per operator emitted by write_end
+        self._shared_comparisons = shared_comparisons
+        self._comparison_ops: set[str] = set()
+        # a comparison is held back until the next command, so that an
+        # if-goto (optionally after a not) can consume it as a direct jump
+        self._fuse_comparisons = fuse_comparisons
+        self._pending_comparison: tuple[str, bool] | None = None
+        # the top of the stack is kept in D instead of memory while
+        # _top_cached is set, and spilled before labels, jumps and calls
+        self._cache_top = cache_top
+        self._top_cached = False
+        self._instruction_count = 0
+        if bootstrap:
+            self._bootstrap()
 
     def set_file_name(self: Self, file_name: str) -> None:
-        print(f"Translating '{file_name}'...")
         self._file_name = file_name
 
+    def get_instruction_count(self: Self) -> int:
+        return self._instruction_count
+
+    def get_shared_routines(self: Self) -> tuple[set[int], set[str]]:
+        return self._call_arg_counts, self._comparison_ops
+
+    def write_fragment(
+        self: Self,
+        text: str,
+        call_arg_counts: set[int],
+        comparison_ops: set[str]
+    ) -> None:
+        # code of a file translated by another writer, the shared routines
+        # it jumps into are emitted once by write_end
+        self._flush()
+        if self._machine:
+            for line in text.splitlines():
+                self._machine.write_instruction(line)
+        else:
+            self._stream.write(text)
+        self._call_arg_counts |= call_arg_counts
+        self._comparison_ops |= comparison_ops
+
     def close(self: Self) -> None:
-        self._stream.close()
+        self._flush()
+        if self._owns_stream:
+            self._stream.close()
+        elif not self._machine:
+            self._stream.flush()
 
     def _bootstrap(self: Self) -> None:
         self._write_lines(
@@ -37,6 +100,13 @@ class CodeWriter:
             "@SP",
             "M=D",
             "",
+        )
+
+        if self._shared_calls:
+            self._write_shared_call("Sys.init", 0, "BOOTSTRAP_RETURN")
+            return
+
+        self._write_lines(
             "// Call Sys.init",
             "// =============================================",
             "",
@@ -102,25 +172,154 @@ class CodeWriter:
         )
 
     def write_pushpop(self: Self, op: str, segment: str, index: int) -> None:
+        self._flush_comparison()
         self._write_comment(op, segment, str(index))
+
+        if self._cache_top:
+            self._write_cached_pushpop(op, segment, index)
+            return
+
         if op == "push":
             self._write_push(segment, index)
         else:
             self._write_pop(segment, index)
 
+    def write_move(
+        self: Self, segment: str, index: int, target: str, target_index: int
+    ) -> None:
+        self._flush()
+        self._write_comment(
+            "push", segment, str(index), "/ pop", target, str(target_index)
+        )
+
+        if self._is_direct(target, target_index, self.STORE_CHAIN):
+            self._write_load(segment, index)
+            self._write_store(target, target_index)
+            return
+
+        self._resolve_address(target, target_index)
+        self._write_lines(
+            "D=A",
+            "@R13",
+            "M=D"
+        )
+        self._write_load(segment, index)
+        self._write_lines(
+            "@R13",
+            "A=M",
+            "M=D"
+        )
+
+    def write_push_arithmetic(
+        self: Self, segment: str, index: int, op: str
+    ) -> None:
+        self._flush_comparison()
+        self._write_comment("push", segment, str(index), "/", op)
+
+        if self._top_cached and (
+            segment == "constant"
+            or self._is_direct(segment, index, self.LOAD_CHAIN)
+        ):
+            # the operand is read straight into the cached top
+            ops = {"add": "D+", "sub": "D-", "and": "D&", "or": "D|"}
+            register = "A" if segment == "constant" else "M"
+            if (
+                segment == "constant" and index in {-1, 1}
+                and op in {"add", "sub"}
+            ):
+                # adding 1 or subtracting -1 is an increment
+                increment = (op == "add") == (index == 1)
+                self._write_line("D=D+1" if increment else "D=D-1")
+                return
+            if segment == "constant" and index == -1:
+                # x & -1 is x, x | -1 is -1
+                if op == "or":
+                    self._write_line("D=-1")
+                return
+            if segment == "static":
+                self._write_line(f"@{self._file_name}.{index}")
+            elif segment == "constant" and index < 0:
+                # an A-instruction only takes non-negative values, and -n
+                # is !(n - 1)
+                self._write_lines(f"@{~index}", "A=!A")
+            elif segment == "constant":
+                self._write_line(f"@{index}")
+            else:
+                self._resolve_address(segment, index)
+            self._write_line(f"D={ops[op]}{register}")
+            return
+
+        self._spill()
+
+        if segment == "constant" and index in {-1, 1} and op in {"add", "sub"}:
+            # adding 1 or subtracting -1 is an increment
+            increment = (op == "add") == (index == 1)
+            self._write_lines(
+                "@SP",
+                "A=M-1",
+                "M=M+1" if increment else "M=M-1"
+            )
+            return
+
+        ops = {"add": "+", "and": "&", "or": "|"}
+        self._write_load(segment, index)
+        self._write_lines(
+            "@SP",
+            "A=M-1",
+            "M=M-D" if op == "sub" else f"M=D{ops[op]}M"
+        )
+
+    def write_push_constant(self: Self, value: int) -> None:
+        # -1, 0 and 1 can be stored directly, without going through D
+        self._flush()
+        self._write_comment("push", "constant", str(value))
+
+        if self._cache_top:
+            self._write_line(f"D={value}")
+            self._top_cached = True
+            return
+
+        self._write_lines(
+            "@SP",
+            "M=M+1",
+            "A=M-1",
+            f"M={value}"
+        )
+
     def write_arithmetic(self: Self, op: str) -> None:
+        if self._pending_comparison and op == "not":
+            comparison, negated = self._pending_comparison
+            self._pending_comparison = comparison, not negated
+            return
+
+        self._flush_comparison()
+        is_comparison = op in {"eq", "lt", "gt"}
+
+        if self._cache_top and not (
+            is_comparison
+            and (self._shared_comparisons or self._fuse_comparisons)
+        ):
+            self._write_cached_arithmetic(op)
+            return
+
+        self._spill()
+
         if op in {"add", "sub", "and", "or"}:
             self._write_binary_arithmetic(op)
         elif op in {"neg", "not"}:
             self._write_unary_arithmetic(op)
+        elif self._fuse_comparisons:
+            self._pending_comparison = op, False
         else:
             self._write_comparison(op)
 
     def write_label(self: Self, label: str) -> None:
+        self._flush()
         self._write_comment("label", label)
         self._write_line(f"({self._get_label(label)})")
 
     def write_goto(self: Self, label: str) -> None:
+        self._flush()
         self._write_comment("goto", label)
         self._write_lines(
             f"@{self._get_label(label)}",
@@ -128,16 +327,25 @@ class CodeWriter:
         )
 
     def write_if(self: Self, label: str) -> None:
+        if self._pending_comparison:
+            self._write_fused_comparison(label)
+            return
+
         self._write_comment("if-goto", label)
+        if not self._top_cached:
+            self._write_lines(
+                "@SP",
+                "AM=M-1",
+                "D=M"
+            )
+        self._top_cached = False
         self._write_lines(
-            "@SP",
-            "AM=M-1",
-            "D=M",
             f"@{self._get_label(label)}",
             "D;JNE"
         )
 
     def write_function(self: Self, name: str, n_args: int) -> None:
+        self._flush()
         self._write_comment("function", name, str(n_args))
         self._function_name = name
         self._call_index = 0
@@ -154,9 +362,14 @@ class CodeWriter:
             )
 
     def write_call(self: Self, name: str, n_args: int) -> None:
+        self._flush()
         self._write_comment("call", name, str(n_args))
         return_label = self._get_return_label()
 
+        if self._shared_calls:
+            self._write_shared_call(name, n_args, return_label)
+            return
+
         self._write_lines(
             f"// Call {name}",
             "// =============================================",
@@ -183,6 +396,16 @@ class CodeWriter:
         )
 
     def write_return(self: Self) -> None:
+        self._flush()
+
+        if self._shared_calls:
+            self._write_comment("return")
+            self._write_lines(
+                "@$RETURN",
+                "0;JMP"
+            )
+            return
+
         self._write_lines(
             "// Return",
             "",
@@ -229,6 +452,7 @@ class CodeWriter:
         )
 
     def write_end(self: Self) -> None:
+        self._flush()
         self._write_comment("end")
         self._write_lines(
             "(END)",
@@ -236,9 +460,139 @@ class CodeWriter:
             "0;JMP"
         )
 
+        if self._shared_calls:
+            self._write_call_routines()
+            self._write_return_routine()
+
+        for op in sorted(self._comparison_ops):
+            self._write_comparison_routine(op)
+
+    def _write_shared_call(
+        self: Self, name: str, n_args: int, return_label: str
+    ) -> None:
+        # R13 = callee, D = return address, $CALL.n does the rest
+        self._call_arg_counts.add(n_args)
+        self._write_lines(
+            f"@{name}",
+            "D=A",
+            "@R13",
+            "M=D",
+            f"@{return_label}",
+            "D=A",
+            f"@$CALL.{n_args}",
+            "0;JMP",
+            f"({return_label})"
+        )
+
+    def _write_call_routines(self: Self) -> None:
+        for n_args in sorted(self._call_arg_counts):
+            self._write_lines(
+                f"// Shared call with {n_args} arguments",
+                f"($CALL.{n_args})",
+                "// Push return address",
+                "@SP",
+                "AM=M+1",
+                "A=A-1",
+                "M=D",
+                f"@{5 + n_args}",
+                "D=A",
+                "@$CALL",
+                "0;JMP",
+            )
+
+        self._write_lines(
+            "// Shared call (D = 5 + n_args, R13 = callee)",
+            "($CALL)",
+            "@R14",
+            "M=D",
+        )
+
+        for label in ["LCL", "ARG", "THIS", "THAT"]:
+            self._write_lines(
+                f"// Save caller's {label}",
+                f"@{label}",
+                "D=M",
+                "@SP",
+                "AM=M+1",
+                "A=A-1",
+                "M=D",
+            )
+
+        self._write_lines(
+            "// Reposition ARG (ARG = SP - 5 - n_args)",
+            "@R14",
+            "D=M",
+            "@SP",
+            "D=M-D",
+            "@ARG",
+            "M=D",
+            "// Reposition LCL (LCL = SP)",
+            "@SP",
+            "D=M",
+            "@LCL",
+            "M=D",
+            "// Transfer control to the callee",
+            "@R13",
+            "A=M",
+            "0;JMP",
+        )
+
+    def _write_return_routine(self: Self) -> None:
+        self._write_lines(
+            "// Shared return",
+            "($RETURN)",
+            "// Frame = LCL",
+            "@LCL",
+            "D=M",
+            "@R13",
+            "M=D",
+            "// RetAddr = *(Frame - 5)",
+            "@5",
+            "A=D-A",
+            "D=M",
+            "@R14",
+            "M=D",
+            "// *ARG = pop()",
+            "@SP",
+            "A=M-1",
+            "D=M",
+            "@ARG",
+            "A=M",
+            "M=D",
+            "// SP = ARG + 1",
+            "@ARG",
+            "D=M+1",
+            "@SP",
+            "M=D",
+        )
+
+        for label in ["THAT", "THIS", "ARG", "LCL"]:
+            self._write_lines(
+                f"// Restore caller's {label}",
+                "@R13",
+                "AM=M-1",
+                "D=M",
+                f"@{label}",
+                "M=D",
+            )
+
+        self._write_lines(
+            "@R14",
+            "A=M",
+            "0;JMP"
+        )
+
     def _get_label(self: Self, label: str) -> str:
         return f"{self._function_name}${label}"
 
+    def _get_comparison_label(self: Self) -> str:
+        # scoped by function, so that functions translated by separate
+        # writers (like the ones of a Library) can be linked together
+        scope = self._function_name or self._file_name
+        label = f"{scope}$COMP_{self._label_index}"
+        self._label_index += 1
+        return label
+
     def _get_return_label(self: Self) -> str:
         label = f"{self._function_name}$ret.{self._call_index}"
         self._call_index += 1
@@ -268,6 +622,15 @@ class CodeWriter:
         )
 
     def _write_pop(self: Self, segment: str, index: int) -> None:
+        if self._is_direct(segment, index, self.STORE_CHAIN):
+            self._write_lines(
+                "@SP",
+                "AM=M-1",
+                "D=M"
+            )
+            self._write_store(segment, index)
+            return
+
         if segment == "static":
             self._write_lines(f"@{self._file_name}.{index}")
         else:
@@ -285,6 +648,31 @@ class CodeWriter:
             "M=D"
         )
 
+    def _write_load(self: Self, segment: str, index: int) -> None:
+        if segment == "constant" and index in {-1, 0, 1}:
+            self._write_lines(f"D={index}")
+        elif segment == "constant":
+            self._write_lines(
+                f"@{index}",
+                "D=A"
+            )
+        elif segment == "static":
+            self._write_lines(
+                f"@{self._file_name}.{index}",
+                "D=M"
+            )
+        else:
+            self._resolve_address(segment, index)
+            self._write_lines("D=M")
+
+    def _write_store(self: Self, segment: str, index: int) -> None:
+        # D is kept, so the address has to be direct
+        if segment == "static":
+            self._write_lines(f"@{self._file_name}.{index}")
+        else:
+            self._resolve_address(segment, index, self.STORE_CHAIN)
+        self._write_lines("M=D")
+
     def _write_binary_arithmetic(self: Self, op: str) -> None:
         ops = {"add": "+", "sub": "-", "and": "&", "or": "|"}
         self._write_lines(
@@ -309,8 +697,19 @@ class CodeWriter:
 
     def _write_comparison(self: Self, op: str) -> None:
         jump = {"eq": "JEQ", "lt": "JLT", "gt": "JGT"}[op]
-        label = f"COMP_{self._label_index}"
-        self._label_index += 1
+        label = self._get_comparison_label()
+
+        if self._shared_comparisons:
+            # D = return address, $EQ / $LT / $GT does the rest
+            self._comparison_ops.add(op)
+            self._write_lines(
+                f"@{label}",
+                "D=A",
+                f"@${op.upper()}",
+                "0;JMP",
+                f"({label})"
+            )
+            return
 
         self._write_lines(
             "@SP",
@@ -332,10 +731,171 @@ class CodeWriter:
             f"({label}_END)"
         )
 
-    def _resolve_address(self: Self, segment: str, index: int) -> None:
+    def _flush(self: Self) -> None:
+        # brings the stack back into memory for code that expects it there
+        self._flush_comparison()
+        self._spill()
+
+    def _spill(self: Self) -> None:
+        if self._top_cached:
+            self._top_cached = False
+            self._write_lines(
+                "@SP",
+                "M=M+1",
+                "A=M-1",
+                "M=D"
+            )
+
+    def _load_top(self: Self) -> None:
+        if not self._top_cached:
+            self._top_cached = True
+            self._write_lines(
+                "@SP",
+                "AM=M-1",
+                "D=M"
+            )
+
+    def _write_cached_pushpop(
+        self: Self, op: str, segment: str, index: int
+    ) -> None:
+        if op == "push":
+            self._spill()
+            self._write_load(segment, index)
+            self._top_cached = True
+            return
+
+        self._load_top()
+        self._top_cached = False
+
+        if self._is_direct(segment, index, self.STORE_CHAIN):
+            self._write_store(segment, index)
+            return
+
+        # the address is computed into R14 with the value parked in R13
+        self._write_lines(
+            "@R13",
+            "M=D"
+        )
+        self._resolve_address(segment, index)
+        self._write_lines(
+            "D=A",
+            "@R14",
+            "M=D",
+            "@R13",
+            "D=M",
+            "@R14",
+            "A=M",
+            "M=D"
+        )
+
+    def _write_cached_arithmetic(self: Self, op: str) -> None:
+        self._load_top()
+
+        if op in {"neg", "not"}:
+            self._write_line("D=-D" if op == "neg" else "D=!D")
+            return
+
+        # the second operand is in D and the first one on the stack
+        self._write_lines(
+            "@SP",
+            "AM=M-1"
+        )
+
+        if op in {"add", "sub", "and", "or"}:
+            ops = {"add": "D+M", "sub": "M-D", "and": "D&M", "or": "D|M"}
+            self._write_line(f"D={ops[op]}")
+            return
+
+        jump = {"eq": "JEQ", "lt": "JLT", "gt": "JGT"}[op]
+        label = self._get_comparison_label()
+        self._write_lines(
+            "D=M-D",
+            f"@{label}_TRUE",
+            f"D;{jump}",
+            "D=0",
+            f"@{label}_END",
+            "0;JMP",
+            f"({label}_TRUE)",
+            "D=-1",
+            f"({label}_END)"
+        )
+
+    def _flush_comparison(self: Self) -> None:
+        if self._pending_comparison:
+            op, negated = self._pending_comparison
+            self._pending_comparison = None
+            self._write_comment(op)
+            self._write_comparison(op)
+            if negated:
+                self._write_comment("not")
+                self._write_unary_arithmetic("not")
+
+    def _write_fused_comparison(self: Self, label: str) -> None:
+        op, negated = self._pending_comparison
+        self._pending_comparison = None
+        jumps = {"eq": "JEQ", "lt": "JLT", "gt": "JGT"}
+        negated_jumps = {"eq": "JNE", "lt": "JGE", "gt": "JLE"}
+        jump = negated_jumps[op] if negated else jumps[op]
+
+        if negated:
+            self._write_comment(op, "not", "if-goto", label)
+        else:
+            self._write_comment(op, "if-goto", label)
+        self._write_lines(
+            "@SP",
+            "AM=M-1",
+            "D=M",
+            "@SP",
+            "AM=M-1",
+            "D=M-D",
+            f"@{self._get_label(label)}",
+            f"D;{jump}"
+        )
+
+    def _write_comparison_routine(self: Self, op: str) -> None:
+        jump = {"eq": "JEQ", "lt": "JLT", "gt": "JGT"}[op]
+        self._write_lines(
+            f"// Shared {op} (D = return address)",
+            f"(${op.upper()})",
+            "@R15",
+            "M=D",
+            "@SP",
+            "AM=M-1",
+            "D=M",
+            "A=A-1",
+            "D=M-D",
+            "M=-1",
+            f"@${op.upper()}_END",
+            f"D;{jump}",
+            "@SP",
+            "A=M-1",
+            "M=0",
+            f"(${op.upper()}_END)",
+            "@R15",
+            "A=M",
+            "0;JMP"
+        )
+
+    def _is_direct(self: Self, segment: str, index: int, chain: int) -> bool:
+        # whether the address of segment[index] is formed without D
+        return (
+            segment == "static"
+            or isinstance(self.SEGMENT_MAP[segment], int)
+            or index <= chain
+        )
+
+    def _resolve_address(
+        self: Self, segment: str, index: int, chain: int = LOAD_CHAIN
+    ) -> None:
         base = self.SEGMENT_MAP[segment]
         if isinstance(base, int):
             self._write_lines(f"@{base + index}")
+        elif index <= chain:
+            self._write_lines(
+                f"@{base}",
+                "A=M" if index == 0 else "A=M+1",
+                *["A=A+1"] * (index - 1)
+            )
         else:
             self._write_lines(
                 f"@{base}",
@@ -349,7 +909,18 @@ class CodeWriter:
             self._write_line(line)
 
     def _write_line(self: Self, line: str) -> None:
-        self._stream.write(line + "\n")
+        if not line or line[0] == "/":
+            if self._comments:
+                self._stream.write(line + "\n")
+            return
+
+        if line[0] != "(":
+            self._instruction_count += 1
+        if self._machine:
+            self._machine.write_instruction(line)
+        else:
+            self._stream.write(line + "\n")
 
     def _write_comment(self: Self, *args: str) -> None:
-        self._write_line(f"// {" ".join(args)}")
+        if self._comments:
+            self._write_line(f"// {" ".join(args)}")
@@ -0,0 +1,207 @@
+from typing import Callable, Self
+from parser import Command
+from linker import Linker
+
+class Inliner:
+    # inlined arguments and locals live in temp 1 to 7, temp 0 is left to
+    # the code of the Jack compiler
+    FIRST_SLOT = 1
+    LAST_SLOT = 7
+
+    def __init__(
+        self: Self,
+        files: list[tuple[str | None, list[Command]]],
+        get_cycles: Callable[[list[Command]], int],
+        get_size: Callable[[list[Command]], int],
+        max_size: int = 12,
+        max_locals: int = 2,
+        budget: int = 2000,
+        library: list[tuple[str, list[Command]]] | None = None
+    ) -> None:
+        # get_cycles gives the cycles taken by straight-line commands and
+        # get_size the number of Hack instructions they are translated to,
+        # which differ once calls jump into shared routines; library gives
+        # the (file name, commands) of the functions linked in from a
+        # Library, which can be inlined into the files but are not
+        # rewritten themselves
+        self._files = files
+        self._library = library or []
+        self._get_cycles = get_cycles
+        self._get_size = get_size
+        self._max_size = max_size
+        self._max_locals = max_locals
+        self._budget = budget
+        # function -> (commands, call sites, cycles saved per call)
+        self._inlined: dict[str, tuple[int, int, int]] = {}
+        self._growth = 0
+        self._site_index = 0
+
+    def inline(self: Self) -> list[tuple[str | None, list[Command]]]:
+        candidates = self._find_candidates()
+        files = []
+        # the temp segment is shared by all functions, so a function further
+        # up the call chain may keep a value in a slot across the call an
+        # inlined body writes it in, slots used anywhere are left alone
+        temps = set().union(*(
+            Inliner._get_temp_indices(commands)
+            for _, commands in [*self._files, *self._library]
+        ))
+
+        for file_name, commands in self._files:
+            out: list[Command] = []
+
+            for _, body in Linker.split_functions(commands):
+                for command in body:
+                    candidate = (
+                        candidates.get(command[1])
+                        if command[0] == "call" else None
+                    )
+                    # statics are named after the file they are used in
+                    if candidate is None or (
+                        candidate[0] != file_name
+                        and Inliner._uses_static(candidate[1])
+                    ):
+                        out.append(command)
+                        continue
+
+                    prologue, inlined, epilogue = self._expand(
+                        command[1], candidate[1], command[2]
+                    )
+                    expansion = prologue + inlined + epilogue
+                    slots = Inliner._get_temp_indices(prologue)
+                    if slots & temps or max(slots, default=0) > self.LAST_SLOT:
+                        out.append(command)
+                        continue
+
+                    # the call, function and return commands are replaced
+                    # by the moves into and out of the temp slots, which
+                    # has to save cycles and fit into the size budget
+                    overhead = [command, candidate[1][0], ("return",)]
+                    saving = self._get_cycles(overhead) - self._get_cycles(
+                        prologue + epilogue
+                    )
+                    growth = self._get_size(expansion) - self._get_size(
+                        [command]
+                    )
+                    if saving <= 0 or self._growth + growth > self._budget:
+                        out.append(command)
+                        continue
+
+                    self._growth += growth
+                    out += expansion
+                    self._record(command[1], len(inlined), saving)
+
+            files.append((file_name, out))
+
+        return files
+
+    def get_inlined(self: Self) -> list[tuple[str, int, int, int]]:
+        # (function, commands, call sites, cycles saved per call) by number
+        # of call sites
+        return sorted(
+            ((name, *inlined) for name, inlined in self._inlined.items()),
+            key=lambda inlined: (-inlined[2], inlined[0])
+        )
+
+    def get_growth(self: Self) -> int:
+        # Hack instructions added to the program by inlining
+        return self._growth
+
+    def _find_candidates(
+        self: Self
+    ) -> dict[str, tuple[str | None, list[Command]]]:
+        # leaf functions only, so an inlined body never has another inlined
+        # body in it competing for the same temp slots, and never recurses
+        candidates = {}
+
+        for file_name, commands in [*self._files, *self._library]:
+            for name, body in Linker.split_functions(commands):
+                if (
+                    name is not None
+                    and len(body) - 1 <= self._max_size
+                    and body[0][2] <= self._max_locals
+                    and not Inliner._get_temp_indices(body) - {0}
+                    and all(c[0] not in {"call", "function"} for c in body[1:])
+                ):
+                    candidates[name] = (file_name, body)
+
+        return candidates
+
+    def _expand(
+        self: Self, name: str, body: list[Command], n_args: int
+    ) -> tuple[list[Command], list[Command], list[Command]]:
+        # call f n -> pop the arguments into temp slots, zero the locals and
+        # save the pointers the body writes, then run the body with every
+        # return turned into a jump to the end, where the pointers are
+        # restored
+        n_locals = body[0][2]
+        pointers = sorted({
+            command[2] for command in body
+            if command[0] == "pop" and command[1] == "pointer"
+        })
+        local_slot = Inliner.FIRST_SLOT + n_args
+        pointer_slot = local_slot + n_locals
+        suffix = f"{name}.inline.{self._site_index}"
+        end = f"END.{suffix}"
+        self._site_index += 1
+
+        prologue: list[Command] = [
+            ("pop", "temp", Inliner.FIRST_SLOT + i)
+            for i in reversed(range(n_args))
+        ]
+        for i in range(n_locals):
+            prologue += [
+                ("push", "constant", 0),
+                ("pop", "temp", local_slot + i)
+            ]
+        for i, pointer in enumerate(pointers):
+            prologue += [
+                ("push", "pointer", pointer),
+                ("pop", "temp", pointer_slot + i)
+            ]
+
+        inlined: list[Command] = []
+        for command in body[1:]:
+            op = command[0]
+            if op in {"push", "pop"} and command[1] == "argument":
+                inlined.append((op, "temp", Inliner.FIRST_SLOT + command[2]))
+            elif op in {"push", "pop"} and command[1] == "local":
+                inlined.append((op, "temp", local_slot + command[2]))
+            elif op in {"label", "goto", "if-goto"}:
+                inlined.append((op, f"{command[1]}.{suffix}"))
+            elif op == "return":
+                inlined.append(("goto", end))
+            else:
+                inlined.append(command)
+
+        if inlined and inlined[-1] == ("goto", end):
+            inlined.pop()
+
+        # the return value stays on top of the stack, a push followed by a
+        # pop of a saved pointer leaves it untouched
+        epilogue: list[Command] = [("label", end)]
+        for i, pointer in enumerate(pointers):
+            epilogue += [
+                ("push", "temp", pointer_slot + i),
+                ("pop", "pointer", pointer)
+            ]
+
+        return prologue, inlined, epilogue
+
+    def _record(self: Self, name: str, size: int, saving: int) -> None:
+        _, sites, _ = self._inlined.get(name, (size, 0, saving))
+        self._inlined[name] = size, sites + 1, saving
+
+    @staticmethod
+    def _get_temp_indices(commands: list[Command]) -> set[int]:
+        return {
+            command[2] for command in commands
+            if command[0] in {"push", "pop"} and command[1] == "temp"
+        }
+
+    @staticmethod
+    def _uses_static(body: list[Command]) -> bool:
+        return any(
+            command[0] in {"push", "pop"} and command[1] == "static"
+            for command in body
+        )
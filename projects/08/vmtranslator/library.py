@@ -0,0 +1,82 @@
+import json
+import sys
+from pathlib import Path
+from typing import Self
+from parser import Command
+
+# (file name, code, call arg counts, comparison ops, called functions,
+# commands) of a function, the code being a fragment for
+# CodeWriter.write_fragment
+Export = tuple[str, str, set[int], set[str], list[str], list[Command]]
+
+class Library:
+    # VM files (like the OS) translated once into one fragment per
+    # function, with an export table of the functions each one calls, so
+    # that a program links in only the functions it reaches, and of its
+    # commands, so that a program can inline the small ones
+    def __init__(self: Self, exports: dict[str, Export]) -> None:
+        self._exports = exports
+
+    @staticmethod
+    def read(path: Path) -> "Library":
+        exports = json.loads(path.read_text())
+        return Library({
+            name: (
+                file_name,
+                code,
+                set(counts),
+                set(ops),
+                calls,
+                [Library._read_command(command) for command in commands]
+            )
+            for name, (file_name, code, counts, ops, calls, commands)
+            in exports.items()
+        })
+
+    def write(self: Self, path: Path) -> None:
+        exports = {
+            name: (file_name, code, sorted(counts), sorted(ops), *rest)
+            for name, (file_name, code, counts, ops, *rest)
+            in self._exports.items()
+        }
+        path.write_text(json.dumps(exports))
+
+    def exclude(
+        self: Self, file_names: set[str], function_names: set[str]
+    ) -> "Library":
+        # the files of a program replace the library files of the same
+        # name, like a class of project 12 replaces the one of the OS
+        return Library({
+            name: export for name, export in self._exports.items()
+            if export[0] not in file_names and name not in function_names
+        })
+
+    def get_calls(self: Self) -> dict[str, list[str]]:
+        return {name: export[4] for name, export in self._exports.items()}
+
+    def get_functions(self: Self) -> list[tuple[str, list[Command]]]:
+        # (file name, commands) of every function
+        return [
+            (export[0], export[5]) for export in self._exports.values()
+        ]
+
+    def get_size(self: Self) -> int:
+        return len(self._exports)
+
+    def get_fragments(
+        self: Self, names: set[str]
+    ) -> list[tuple[str, set[int], set[str]]]:
+        # in library order, so the output does not depend on the set order
+        return [
+            (code, counts, ops)
+            for name, (_, code, counts, ops, _, _) in self._exports.items()
+            if name in names
+        ]
+
+    @staticmethod
+    def _read_command(command: list) -> Command:
+        # with the strings interned, like the commands read by the Parser
+        return tuple(
+            sys.intern(arg) if isinstance(arg, str) else arg
+            for arg in command
+        )
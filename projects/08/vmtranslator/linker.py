@@ -0,0 +1,81 @@
+from typing import Self
+from parser import Command
+
+class Linker:
+    ROOT = "Sys.init"
+
+    def __init__(
+        self: Self,
+        files: list[tuple[str | None, list[Command]]],
+        library_calls: dict[str, list[str]] | None = None
+    ) -> None:
+        # library_calls gives the functions called by each function that
+        # is linked in from a Library instead of being translated
+        self._files = files
+        self._library_calls = library_calls or {}
+        self._removed: list[tuple[str, list[Command]]] = []
+
+    def link(self: Self) -> list[tuple[str | None, list[Command]]]:
+        functions = {
+            name: body
+            for _, commands in self._files
+            for name, body in Linker.split_functions(commands)
+            if name is not None
+        }
+
+        calls = dict(self._library_calls)
+        for name, body in functions.items():
+            calls[name] = [
+                command[1] for command in body if command[0] == "call"
+            ]
+
+        # without Sys.init the program has no single entry point (like the
+        # tests of project 07), so nothing can be proven unreachable
+        if Linker.ROOT not in calls:
+            return self._files
+
+        reachable = Linker.get_reachable(calls, [Linker.ROOT])
+        files = []
+
+        for file_name, commands in self._files:
+            kept = []
+            for name, body in Linker.split_functions(commands):
+                if name is None or name in reachable:
+                    kept += body
+                else:
+                    self._removed.append((name, body))
+            files.append((file_name, kept))
+
+        return files
+
+    def get_removed_functions(self: Self) -> list[tuple[str, list[Command]]]:
+        return self._removed
+
+    @staticmethod
+    def split_functions(
+        commands: list[Command]
+    ) -> list[tuple[str | None, list[Command]]]:
+        # commands before the first function of a file belong to no function
+        functions: list[tuple[str | None, list[Command]]] = [(None, [])]
+
+        for command in commands:
+            if command[0] == "function":
+                functions.append((command[1], []))
+            functions[-1][1].append(command)
+
+        return functions
+
+    @staticmethod
+    def get_reachable(
+        calls: dict[str, list[str]], roots: list[str]
+    ) -> set[str]:
+        reachable = set(roots)
+        pending = list(roots)
+
+        while pending:
+            for name in calls.get(pending.pop(), []):
+                if name not in reachable:
+                    reachable.add(name)
+                    pending.append(name)
+
+        return reachable
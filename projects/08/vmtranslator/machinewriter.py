@@ -0,0 +1,60 @@
+from pathlib import Path
+from typing import BinaryIO, Self, TextIO
+from hackcode import PREDEFINED_SYMBOLS, code_instruction
+
+class MachineWriter:
+    # the output of a CodeWriter that turns the instructions it writes into
+    # Hack machine words, without an assembly file between
+    def __init__(
+        self: Self,
+        path: Path | TextIO | None,
+        packed_path: Path | BinaryIO | None = None
+    ) -> None:
+        self._path = path
+        self._packed_path = packed_path
+        self._words: list[int] = []
+        self._labels: dict[str, int] = {}
+        self._fixups: list[tuple[int, str]] = []
+
+    def write_instruction(self: Self, line: str) -> None:
+        # a label declaration is recorded at the address of the next word
+        if line[0] == "(":
+            self._labels[line[1:-1]] = len(self._words)
+        elif line[0] != "@":
+            self._words.append(code_instruction(line))
+        elif line[1:].isdigit():
+            self._words.append(int(line[1:]))
+        else:
+            self._fixups.append((len(self._words), line[1:]))
+            self._words.append(0)
+
+    def close(self: Self) -> None:
+        self._resolve_symbols()
+
+        if self._path is not None:
+            text = "".join(f"{word:016b}\n" for word in self._words)
+            if isinstance(self._path, Path):
+                self._path.write_text(text)
+            else:
+                self._path.write(text)
+                self._path.flush()
+
+        if self._packed_path is not None:
+            data = b"".join(word.to_bytes(2, "little") for word in self._words)
+            if isinstance(self._packed_path, Path):
+                self._packed_path.write_bytes(data)
+            else:
+                self._packed_path.write(data)
+                self._packed_path.flush()
+
+    def _resolve_symbols(self: Self) -> None:
+        # variables get addresses from 16 on in order of first reference,
+        # the same as when the assembly is assembled
+        symbols = {**PREDEFINED_SYMBOLS, **self._labels}
+        address = 16
+
+        for index, symbol in self._fixups:
+            if symbol not in symbols:
+                symbols[symbol] = address
+                address += 1
+            self._words[index] = symbols[symbol]
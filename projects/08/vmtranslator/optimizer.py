@@ -0,0 +1,71 @@
+from typing import Iterable, Iterator, Self
+from parser import Command
+
+# the commands read by the Parser, plus the fused commands only produced
+# here:
+# ("move", segment, index, segment, index) - push followed by pop
+# ("push-arithmetic", segment, index, op) - push followed by add/sub/and/or
+# ("push-constant", value) - push of -1, 0 or 1
+#
+# true is rewritten into ("push", "constant", -1) before it is fused, so
+# the constant index of move and push-arithmetic can be -1, the only
+# negative constant a CodeWriter has to handle
+
+class PeepholeOptimizer:
+    def __init__(self: Self, commands: Iterable[Command]) -> None:
+        self._commands = commands
+
+    def optimize(self: Self) -> list[Command]:
+        return list(self.stream())
+
+    def stream(self: Self) -> Iterator[Command]:
+        # each command is pushed onto the output and the rules are retried
+        # on its tail, so one rewrite can enable the next one; a rewrite
+        # never combines with the command before it, so a command is final
+        # once the next one has been pushed and yielded right away
+        out: list[Command] = []
+
+        for command in self._commands:
+            out.append(command)
+            while PeepholeOptimizer._apply_rules(out):
+                pass
+            if len(out) > 1:
+                yield PeepholeOptimizer._replace_small_constant(out.pop(0))
+
+        yield from map(PeepholeOptimizer._replace_small_constant, out)
+
+    @staticmethod
+    def _apply_rules(out: list[Command]) -> bool:
+        if len(out) < 2 or out[-2][0] != "push":
+            return False
+
+        _, segment, index = out[-2]
+        last = out[-1]
+
+        # push constant 0 / not -> push constant -1, and the same for
+        # push constant 1 / neg, which is how true is usually pushed
+        if (segment, index, last) in _TRUE_PATTERNS:
+            out[-2:] = [("push", "constant", -1)]
+            return True
+
+        # push / pop -> move, without the stack round trip
+        if last[0] == "pop":
+            out[-2:] = [("move", segment, index, last[1], last[2])]
+            return True
+
+        # push / binary op -> op applied in place on the stack top
+        if last[0] in _BINARY_OPS:
+            out[-2:] = [("push-arithmetic", segment, index, last[0])]
+            return True
+
+        return False
+
+    @staticmethod
+    def _replace_small_constant(command: Command) -> Command:
+        if command[:2] == ("push", "constant") and command[2] in {-1, 0, 1}:
+            return ("push-constant", command[2])
+        return command
+
+_TRUE_PATTERNS = {("constant", 0, ("not",)), ("constant", 1, ("neg",))}
+
+_BINARY_OPS = {"add", "sub", "and", "or"}
@@ -1,57 +1,42 @@
+import sys
 from pathlib import Path
-from typing import Self, Iterator
+from typing import Self, Iterator, TextIO
+
+# ("push", segment, index) | ("pop", segment, index) | ("add",) | ...
+# with the opcode always one of the interned strings of _OPCODES, names
+# and labels interned and indices already ints, shared by every stage
+Command = tuple
 
 class Parser:
-    def __init__(self: Self, path: Path) -> None:
-        self._stream = open(path)
+    def __init__(self: Self, path: Path | TextIO) -> None:
+        self._owns_stream = isinstance(path, Path)
+        self._stream = open(path) if isinstance(path, Path) else path
         self._iterator = self._get_iterator()
-        self._args = []
+        self._commands = self._parse_commands()
 
     def close(self: Self) -> None:
-        self._stream.close()
-
-    def has_more_lines(self: Self) -> bool:
-        try:
-            line = next(self._iterator)
-            self._args = line.split(" ")
-            return True
-        except StopIteration:
-            return False
-
-    def is_pushpop(self: Self) -> bool:
-        return self.get_op() in {"push", "pop"}
-
-    def is_arithmetic(self: Self) -> bool:
-        return self.get_op() in {"add" , "sub", "neg",
-                                 "and", "or", "not",
-                                 "eq", "lt", "gt"}
-
-    def is_label(self: Self) -> bool:
-        return self.get_op() == "label"
+        if self._owns_stream:
+            self._stream.close()
 
-    def is_goto(self: Self) -> bool:
-        return self.get_op() == "goto"
+    def read_commands(self: Self) -> Iterator[Command]:
+        return self._commands
 
-    def is_if(self: Self) -> bool:
-        return self.get_op() == "if-goto"
+    def _parse_commands(self: Self) -> Iterator[Command]:
+        # each line is split once, into a tuple of the size of its command
+        intern = sys.intern
+        for line in self._iterator:
+            args = line.split()
+            opcode, n_args = _OPCODES.get(args[0], (None, -1))
 
-    def is_function(self: Self) -> bool:
-        return self.get_op() == "function"
+            if n_args != len(args) - 1:
+                raise ValueError(f"invalid command '{line}'")
 
-    def is_return(self: Self) -> bool:
-        return self.get_op() == "return"
-
-    def is_call(self: Self) -> bool:
-        return self.get_op() == "call"
-
-    def get_op(self: Self) -> str:
-        return self._args[0]
-
-    def get_arg1(self: Self) -> str:
-        return self._args[1]
-
-    def get_arg2(self: Self) -> int:
-        return int(self._args[2])
+            if not n_args:
+                yield opcode,
+            elif n_args == 1:
+                yield opcode, intern(args[1])
+            else:
+                yield opcode, intern(args[1]), int(args[2])
 
     def _get_iterator(self: Self) -> Iterator[str]:
         for line in self._stream:
@@ -62,3 +47,25 @@ class Parser:
     @staticmethod
     def _clean_line(line: str) -> str:
         return line.split("//")[0].strip()
+
+ARITHMETIC_OPS = frozenset({
+    "add", "sub", "neg",
+    "and", "or", "not",
+    "eq", "lt", "gt"
+})
+
+# opcode -> (interned opcode, number of arguments)
+_OPCODES = {
+    op: (sys.intern(op), n_args)
+    for op, n_args in [
+        *[(op, 0) for op in ARITHMETIC_OPS],
+        ("push", 2),
+        ("pop", 2),
+        ("label", 1),
+        ("goto", 1),
+        ("if-goto", 1),
+        ("function", 2),
+        ("call", 2),
+        ("return", 0)
+    ]
+}
@@ -0,0 +1,127 @@
+from typing import Self, TextIO
+
+class Profiler:
+    # fed by the VMEmulator on every call and return, steps counts the
+    # commands executed so far in the current run and peak is the highest
+    # stack pointer since the previous call or return
+    def __init__(self: Self, root: str) -> None:
+        self._calls: dict[str, int] = {root: 1}
+        self._exclusive: dict[str, int] = {}
+        self._inclusive: dict[str, int] = {}
+        self._max_depth: dict[str, int] = {root: 0}
+        self._collapsed: dict[str, int] = {}
+        # (function, collapsed stack, steps at entry) of every active call
+        self._stack: list[tuple[str, str, int]] = [(root, root, 0)]
+        self._active: dict[str, int] = {root: 1}
+        # the highest stack pointer of every active call, the calls it made
+        # included, and the one the first run started with
+        self._peaks: list[int] = [0]
+        self._initial_sp: int | None = None
+        self._base = 0
+        self._mark = 0
+
+    def start(self: Self, sp: int) -> None:
+        # beginning of a run, depths are counted from the stack pointer of
+        # the first one
+        if self._initial_sp is None:
+            self._initial_sp = sp
+        self._peaks[-1] = max(self._peaks[-1], sp)
+
+    def enter(self: Self, name: str, steps: int, peak: int) -> None:
+        # the peak belongs to the caller, the frame pushed by the call to
+        # the callee
+        self._attribute(steps, peak)
+        self._calls[name] = self._calls.get(name, 0) + 1
+        self._max_depth.setdefault(name, 0)
+        self._active[name] = self._active.get(name, 0) + 1
+        stack = f"{self._stack[-1][1]};{name}"
+        self._stack.append((name, stack, self._base + steps))
+        self._peaks.append(0)
+
+    def leave(self: Self, steps: int, peak: int) -> None:
+        self._attribute(steps, peak)
+        # the returning root frame (like a test without Sys.init) is kept
+        if len(self._stack) == 1:
+            return
+
+        name, _, entry = self._stack.pop()
+        peak = self._peaks.pop()
+        self._peaks[-1] = max(self._peaks[-1], peak)
+        self._max_depth[name] = max(
+            self._max_depth[name], self._get_depth(peak)
+        )
+        self._active[name] -= 1
+        # recursive calls are already included in their outermost call
+        if not self._active[name]:
+            self._inclusive[name] = (
+                self._inclusive.get(name, 0) + self._base + steps - entry
+            )
+
+    def stop(self: Self, steps: int, peak: int) -> None:
+        # end of a run, the counts of the active calls are brought up to date
+        self._attribute(steps, peak)
+        self._base += steps
+        self._mark = 0
+
+    def get_results(self: Self) -> list[tuple[str, int, int, int, int]]:
+        # (function, calls, exclusive, inclusive, max depth) by exclusive
+        # count, calls that have not returned yet count up to now
+        total = self._base
+        inclusive = dict(self._inclusive)
+        max_depth = dict(self._max_depth)
+        counted = set()
+
+        for name, _, entry in self._stack:
+            if name not in counted:
+                counted.add(name)
+                inclusive[name] = inclusive.get(name, 0) + total - entry
+
+        # the peak of an active call includes the ones of the calls above it
+        peak = 0
+        for (name, _, _), frame_peak in zip(
+            reversed(self._stack), reversed(self._peaks)
+        ):
+            peak = max(peak, frame_peak)
+            max_depth[name] = max(max_depth[name], self._get_depth(peak))
+
+        results = [
+            (
+                name,
+                calls,
+                self._exclusive.get(name, 0),
+                inclusive.get(name, 0),
+                max_depth[name]
+            )
+            for name, calls in self._calls.items()
+        ]
+        return sorted(results, key=lambda result: (-result[2], result[0]))
+
+    def write_table(self: Self, stream: TextIO) -> None:
+        total = max(self._base, 1)
+        stream.write(
+            f"{'function':<32} {'calls':>9} {'exclusive':>11} {'%':>6} "
+            f"{'inclusive':>11} {'%':>6} {'max depth':>9}\n"
+        )
+        for name, calls, exclusive, inclusive, depth in self.get_results():
+            stream.write(
+                f"{name:<32} {calls:>9} {exclusive:>11} "
+                f"{100 * exclusive / total:>6.2f} {inclusive:>11} "
+                f"{100 * inclusive / total:>6.2f} {depth:>9}\n"
+            )
+
+    def write_collapsed(self: Self, stream: TextIO) -> None:
+        # one "caller;callee count" line per stack, as read by flamegraph.pl
+        for stack, count in sorted(self._collapsed.items()):
+            stream.write(f"{stack} {count}\n")
+
+    def _attribute(self: Self, steps: int, peak: int) -> None:
+        name, stack, _ = self._stack[-1]
+        count = steps - self._mark
+        self._exclusive[name] = self._exclusive.get(name, 0) + count
+        if count:
+            self._collapsed[stack] = self._collapsed.get(stack, 0) + count
+        self._mark = steps
+        self._peaks[-1] = max(self._peaks[-1], peak)
+
+    def _get_depth(self: Self, peak: int) -> int:
+        return max(peak - (self._initial_sp or 0), 0)
@@ -0,0 +1,19 @@
+// Tests NegativeConstantTest.asm on the CPU emulator.
+// Translate it with --no-bootstrap -O, and again with
+// --no-bootstrap --cache-top -O, first.
+
+load NegativeConstantTest.asm,
+output-file NegativeConstantTest.out,
+compare-to NegativeConstantTest.cmp,
+
+set RAM[0] 256,  // initializes the stack pointer
+
+repeat 1000 {    // enough cycles to complete the execution
+  ticktock;
+}
+
+// Outputs the stack pointer and the temp segment: RAM[5]-RAM[10]
+output-list RAM[0]%D2.6.2
+        RAM[5]%D2.6.2 RAM[6]%D2.6.2 RAM[7]%D2.6.2 RAM[8]%D2.6.2
+        RAM[9]%D2.6.2 RAM[10]%D2.6.2;
+output;
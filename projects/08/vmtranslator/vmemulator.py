@@ -0,0 +1,472 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Self
+from parser import Parser
+from profiler import Profiler
+
+class VMEmulator:
+    RAM_SIZE = 32768
+
+    def __init__(self: Self, path: Path, profile: bool = False) -> None:
+        self._ops: list[int] = []
+        self._args: list[int] = []
+        self._args2: list[int] = []
+        self._ram = [0] * VMEmulator.RAM_SIZE
+        self._statics: dict[str, int] = {}
+        self._functions: dict[str, int] = {}
+        self._function_names: dict[int, str] = {}
+        self._halted = False
+        # calls, returns and pushes are only decoded into their profiled
+        # opcodes when profiling, so the regular ones pay nothing for it
+        self._profile = profile
+        self._load(VMEmulator._get_input_paths(path))
+
+        # like the VM emulator, a program with Sys.init starts there with an
+        # empty stack, otherwise with the first command and a bare RAM
+        self._pc = self._functions.get("Sys.init", 0)
+        if "Sys.init" in self._functions:
+            self._ram[0] = 256
+
+        self._profiler = None
+        if profile:
+            self._profiler = Profiler(self._get_function_name(self._pc))
+
+    def run(self: Self, steps: int | None = None) -> int:
+        # executes up to steps commands (all of them when None) and returns
+        # the number executed, which is less once the program halts
+        ops, args, args2 = self._ops, self._args, self._args2
+        ram = self._ram
+        profiler = self._profiler
+        names = self._function_names
+        pc = self._pc
+        end = len(ops)
+        limit = -1 if steps is None else steps
+        n = 0
+        # the highest stack pointer since the last call or return, only
+        # tracked by the profiled opcodes
+        peak = ram[0]
+        if profiler:
+            profiler.start(peak)
+
+        while n != limit and not self._halted:
+            if pc >= end or pc < 0:
+                self._halted = True
+                break
+
+            op = ops[pc]
+            n += 1
+
+            if op == _PUSH_CONSTANT:
+                sp = ram[0]
+                ram[sp] = args[pc]
+                ram[0] = sp + 1
+                pc += 1
+            elif op == _PUSH_INDIRECT:
+                sp = ram[0]
+                ram[sp] = ram[ram[args[pc]] + args2[pc]]
+                ram[0] = sp + 1
+                pc += 1
+            elif op == _PUSH_DIRECT:
+                sp = ram[0]
+                ram[sp] = ram[args[pc]]
+                ram[0] = sp + 1
+                pc += 1
+            elif op == _POP_INDIRECT:
+                sp = ram[0] - 1
+                ram[ram[args[pc]] + args2[pc]] = ram[sp]
+                ram[0] = sp
+                pc += 1
+            elif op == _POP_DIRECT:
+                sp = ram[0] - 1
+                ram[args[pc]] = ram[sp]
+                ram[0] = sp
+                pc += 1
+            elif op == _ADD:
+                sp = ram[0] - 1
+                ram[sp - 1] = (ram[sp - 1] + ram[sp] + 32768 & 0xFFFF) - 32768
+                ram[0] = sp
+                pc += 1
+            elif op == _SUB:
+                sp = ram[0] - 1
+                ram[sp - 1] = (ram[sp - 1] - ram[sp] + 32768 & 0xFFFF) - 32768
+                ram[0] = sp
+                pc += 1
+            elif op == _IF_GOTO:
+                sp = ram[0] - 1
+                ram[0] = sp
+                pc = args[pc] if ram[sp] else pc + 1
+            elif op == _GOTO:
+                pc = args[pc]
+            elif op == _EQ:
+                sp = ram[0] - 1
+                ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+                ram[0] = sp
+                pc += 1
+            elif op == _LT:
+                sp = ram[0] - 1
+                ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+                ram[0] = sp
+                pc += 1
+            elif op == _GT:
+                sp = ram[0] - 1
+                ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+                ram[0] = sp
+                pc += 1
+            elif op == _NOT:
+                sp = ram[0] - 1
+                ram[sp] = ~ram[sp]
+                pc += 1
+            elif op == _NEG:
+                sp = ram[0] - 1
+                ram[sp] = (32768 - ram[sp] & 0xFFFF) - 32768
+                pc += 1
+            elif op == _AND:
+                sp = ram[0] - 1
+                ram[sp - 1] &= ram[sp]
+                ram[0] = sp
+                pc += 1
+            elif op == _OR:
+                sp = ram[0] - 1
+                ram[sp - 1] |= ram[sp]
+                ram[0] = sp
+                pc += 1
+            elif op == _CALL:
+                sp = ram[0]
+                ram[sp] = pc + 1
+                ram[sp + 1] = ram[1]
+                ram[sp + 2] = ram[2]
+                ram[sp + 3] = ram[3]
+                ram[sp + 4] = ram[4]
+                ram[0] = ram[1] = sp + 5
+                ram[2] = sp - args2[pc]
+                pc = args[pc]
+            elif op == _FUNCTION:
+                sp = ram[0]
+                n_locals = args[pc]
+                ram[sp:sp + n_locals] = [0] * n_locals
+                ram[0] = sp + n_locals
+                pc += 1
+            elif op == _RETURN:
+                # the return address is read first, with no arguments it is
+                # overwritten by the return value
+                frame = ram[1]
+                arg = ram[2]
+                return_address = ram[frame - 5]
+                ram[arg] = ram[ram[0] - 1]
+                ram[0] = arg + 1
+                ram[4] = ram[frame - 1]
+                ram[3] = ram[frame - 2]
+                ram[2] = ram[frame - 3]
+                ram[1] = ram[frame - 4]
+                pc = return_address
+            elif op == _CALL_PROFILED:
+                sp = ram[0]
+                ram[sp] = pc + 1
+                ram[sp + 1] = ram[1]
+                ram[sp + 2] = ram[2]
+                ram[sp + 3] = ram[3]
+                ram[sp + 4] = ram[4]
+                ram[0] = ram[1] = sp + 5
+                ram[2] = sp - args2[pc]
+                pc = args[pc]
+                profiler.enter(names[pc], n, peak)
+                peak = sp + 5
+            elif op == _RETURN_PROFILED:
+                frame = ram[1]
+                arg = ram[2]
+                return_address = ram[frame - 5]
+                ram[arg] = ram[ram[0] - 1]
+                ram[0] = arg + 1
+                ram[4] = ram[frame - 1]
+                ram[3] = ram[frame - 2]
+                ram[2] = ram[frame - 3]
+                ram[1] = ram[frame - 4]
+                pc = return_address
+                profiler.leave(n, peak)
+                peak = ram[0]
+            elif op == _PUSH_CONSTANT_PROFILED:
+                sp = ram[0]
+                ram[sp] = args[pc]
+                ram[0] = sp + 1
+                pc += 1
+                if sp >= peak:
+                    peak = sp + 1
+            elif op == _PUSH_INDIRECT_PROFILED:
+                sp = ram[0]
+                ram[sp] = ram[ram[args[pc]] + args2[pc]]
+                ram[0] = sp + 1
+                pc += 1
+                if sp >= peak:
+                    peak = sp + 1
+            elif op == _PUSH_DIRECT_PROFILED:
+                sp = ram[0]
+                ram[sp] = ram[args[pc]]
+                ram[0] = sp + 1
+                pc += 1
+                if sp >= peak:
+                    peak = sp + 1
+            else:
+                n -= 1
+                self._halted = True
+
+        if profiler:
+            profiler.stop(n, max(peak, ram[0]))
+
+        self._pc = pc
+        return n
+
+    def is_halted(self: Self) -> bool:
+        return self._halted
+
+    def get_ram(self: Self, address: int) -> int:
+        return self._ram[address]
+
+    def set_ram(self: Self, address: int, value: int) -> None:
+        self._ram[address] = (value + 32768 & 0xFFFF) - 32768
+
+    def get_static_address(self: Self, file_name: str, index: int) -> int:
+        return self._statics[f"{file_name}.{index}"]
+
+    def get_profiler(self: Self) -> Profiler | None:
+        return self._profiler
+
+    def _get_function_name(self: Self, pc: int) -> str:
+        # name of the function the command at pc belongs to
+        _, name = max(
+            (
+                (index, name) for name, index in self._functions.items()
+                if index <= pc
+            ),
+            default=(0, "<top>")
+        )
+        return name
+
+    def _load(self: Self, paths: list[Path]) -> None:
+        # labels and functions are resolved once all files are read, so
+        # every jump and call target is a command index while running
+        labels: dict[str, int] = {}
+        jumps: list[tuple[int, str]] = []
+        calls: list[tuple[int, str]] = []
+
+        for path in paths:
+            parser = Parser(path)
+            file_name = path.name.removesuffix(".vm")
+            function_name = ""
+
+            for command in parser.read_commands():
+                op = command[0]
+                index = len(self._ops)
+
+                if op in {"push", "pop"}:
+                    self._add_pushpop(*command, file_name)
+                    if op == "push" and self._profile:
+                        # pushes raise the stack pointer, the profiled ones
+                        # also track its peak
+                        self._ops[-1] = _PROFILED_PUSHES[self._ops[-1]]
+                elif op in _ARITHMETIC_OPS:
+                    self._add(_ARITHMETIC_OPS[op])
+                elif op == "label":
+                    labels[f"{function_name}${command[1]}"] = index
+                elif op in {"goto", "if-goto"}:
+                    jumps.append((index, f"{function_name}${command[1]}"))
+                    self._add(_GOTO if op == "goto" else _IF_GOTO)
+                elif op == "function":
+                    function_name = command[1]
+                    self._functions[function_name] = index
+                    self._add(_FUNCTION, command[2])
+                elif op == "return":
+                    self._add(_RETURN_PROFILED if self._profile else _RETURN)
+                elif command[1] == "Sys.halt":
+                    # Sys.halt loops forever, the emulator stops instead
+                    self._add(_HALT)
+                else:
+                    calls.append((index, command[1]))
+                    self._add(
+                        _CALL_PROFILED if self._profile else _CALL,
+                        0,
+                        command[2]
+                    )
+
+            parser.close()
+
+        for index, label in jumps:
+            self._args[index] = labels[label]
+            # a goto to itself is how a program stops, so stop there
+            if self._ops[index] == _GOTO and labels[label] == index:
+                self._ops[index] = _HALT
+
+        for index, name in calls:
+            if name not in self._functions:
+                raise ValueError(f"call of undefined function '{name}'")
+            self._args[index] = self._functions[name]
+
+        self._function_names = {
+            index: name for name, index in self._functions.items()
+        }
+
+    def _add_pushpop(
+        self: Self, op: str, segment: str, index: int, file_name: str
+    ) -> None:
+        if segment == "constant":
+            self._add(_PUSH_CONSTANT, index)
+            return
+
+        if segment in _POINTERS:
+            self._add(
+                _PUSH_INDIRECT if op == "push" else _POP_INDIRECT,
+                _POINTERS[segment],
+                index
+            )
+            return
+
+        if segment == "static":
+            # statics get addresses from 16 on in order of first reference,
+            # the same as in a translated and assembled program
+            name = f"{file_name}.{index}"
+            if name not in self._statics:
+                self._statics[name] = 16 + len(self._statics)
+            address = self._statics[name]
+        else:
+            address = _FIXED_SEGMENTS[segment] + index
+
+        self._add(_PUSH_DIRECT if op == "push" else _POP_DIRECT, address)
+
+    def _add(self: Self, op: int, arg: int = 0, arg2: int = 0) -> None:
+        self._ops.append(op)
+        self._args.append(arg)
+        self._args2.append(arg2)
+
+    @staticmethod
+    def _get_input_paths(path: Path) -> list[Path]:
+        if path.is_file():
+            return [path]
+        return sorted(path.glob("*.vm"))
+
+(
+    _PUSH_CONSTANT, _PUSH_INDIRECT, _PUSH_DIRECT, _POP_INDIRECT, _POP_DIRECT,
+    _ADD, _SUB, _NEG, _EQ, _GT, _LT, _AND, _OR, _NOT,
+    _GOTO, _IF_GOTO, _FUNCTION, _CALL, _RETURN, _HALT,
+    _CALL_PROFILED, _RETURN_PROFILED, _PUSH_CONSTANT_PROFILED,
+    _PUSH_INDIRECT_PROFILED, _PUSH_DIRECT_PROFILED
+) = range(25)
+
+_PROFILED_PUSHES = {
+    _PUSH_CONSTANT: _PUSH_CONSTANT_PROFILED,
+    _PUSH_INDIRECT: _PUSH_INDIRECT_PROFILED,
+    _PUSH_DIRECT: _PUSH_DIRECT_PROFILED
+}
+
+_ARITHMETIC_OPS = {
+    "add": _ADD,
+    "sub": _SUB,
+    "neg": _NEG,
+    "eq": _EQ,
+    "gt": _GT,
+    "lt": _LT,
+    "and": _AND,
+    "or": _OR,
+    "not": _NOT
+}
+
+_POINTERS = {"local": 1, "argument": 2, "this": 3, "that": 4}
+
+_FIXED_SEGMENTS = {"pointer": 3, "temp": 5}
+
+def validate_path(path_str: str) -> Path:
+    path_suffix = ".vm"
+    path = Path(path_str)
+
+    if not path.exists():
+        raise argparse.ArgumentTypeError(f"file '{path}' does not exist")
+    if path.is_file() and path.suffix != path_suffix:
+        raise argparse.ArgumentTypeError(
+            f"file extension must be '{path_suffix}', but got '{path.suffix}'"
+        )
+
+    return path
+
+def validate_assignment(assignment_str: str) -> tuple[int, int]:
+    try:
+        address, value = assignment_str.split("=")
+        return int(address), int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"expected ADDRESS=VALUE, but got '{assignment_str}'"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run VM code without translating it to Hack assembly."
+    )
+    parser.add_argument(
+        "path",
+        type=validate_path,
+        help="Path to .vm file or directory"
+    )
+    parser.add_argument(
+        "-n", "--steps",
+        type=int,
+        default=None,
+        help="number of commands to execute (default: until the program "
+             "halts)"
+    )
+    parser.add_argument(
+        "--set",
+        type=validate_assignment,
+        action="append",
+        default=[],
+        metavar="ADDRESS=VALUE",
+        help="set a RAM word before running, can be repeated"
+    )
+    parser.add_argument(
+        "--print",
+        type=int,
+        nargs="*",
+        default=[0],
+        metavar="ADDRESS",
+        help="RAM words to print after running (default: 0)"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print the calls, exclusive and inclusive command counts and "
+             "maximum stack depth of every function after running"
+    )
+    parser.add_argument(
+        "--collapsed",
+        type=Path,
+        default=None,
+        metavar="PATH",
+        help="write the profile as collapsed stacks for flame graphs"
+    )
+    args = parser.parse_args()
+
+    emulator = VMEmulator(args.path, args.profile or bool(args.collapsed))
+    for address, value in args.set:
+        emulator.set_ram(address, value)
+
+    start = time.perf_counter()
+    steps = emulator.run(args.steps)
+    elapsed = time.perf_counter() - start
+
+    for address in args.print:
+        print(f"RAM[{address}] = {emulator.get_ram(address)}")
+    print(
+        f"Executed {steps} commands in {elapsed:.3f}s"
+        f"{", halted" if emulator.is_halted() else ""}",
+        file=sys.stderr
+    )
+
+    profiler = emulator.get_profiler()
+    if args.profile:
+        profiler.write_table(sys.stdout)
+    if args.collapsed:
+        with open(args.collapsed, "w") as stream:
+            profiler.write_collapsed(stream)
+
+if __name__ == "__main__":
+    main()
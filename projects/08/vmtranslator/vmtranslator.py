@@ -1,63 +1,453 @@
 #!/usr/bin/env python
 
 import argparse
+import io
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Self
-from parser import Parser
+from typing import Callable, Iterable, Iterator, Self, TextIO
+# modules shared by the toolchain, like the cache, live in projects/common
+sys.path.append(str(Path(__file__).resolve().parents[2] / "common"))
+from parser import ARITHMETIC_OPS, Command, Parser
 from codewriter import CodeWriter
+from optimizer import PeepholeOptimizer
+from linker import Linker
+from inliner import Inliner
+from library import Library
+from machinewriter import MachineWriter
+from toolcache import Cache
 
 class VMTranslator:
-    def __init__(self: Self, path: Path) -> None:
-        self._input_path = VMTranslator._get_input_paths(path)
-        self._output_path = VMTranslator._get_output_path(path)
+    def __init__(
+        self: Self,
+        path: Path,
+        cache: Cache | None = None,
+        stdout: bool = False,
+        shared_calls: bool = False,
+        shared_comparisons: bool = False,
+        fuse_comparisons: bool = False,
+        optimize: bool = False,
+        prune: bool = False,
+        jobs: int | None = None,
+        hack: bool = False,
+        packed: bool = False,
+        inline: bool = False,
+        inline_budget: int = 2000,
+        cache_top: bool = False,
+        library: Path | None = None,
+        bootstrap: bool = True
+    ) -> None:
+        self._input_path: Path | list[Path] | TextIO
+        self._output_path: Path | TextIO
+        # machine code is written instead of assembly when hack is set
+        self._hack = hack or packed
+        self._packed = packed
+        suffix = ".hack" if self._hack else ".asm"
+
+        if path == STDIN:
+            self._input_path = sys.stdin
+            self._output_path = sys.stdout
+        else:
+            self._input_path = VMTranslator._get_input_paths(path)
+            self._output_path = (
+                sys.stdout if stdout
+                else VMTranslator._get_output_path(path, suffix)
+            )
+
+        self._cache = cache if isinstance(self._output_path, Path) else None
+        self._shared_calls = shared_calls
+        self._shared_comparisons = shared_comparisons
+        self._fuse_comparisons = fuse_comparisons
+        self._optimize = optimize
+        self._prune = prune
+        self._jobs = jobs
+        self._inline = inline
+        self._inline_budget = inline_budget
+        self._cache_top = cache_top
+        self._bootstrap = bootstrap
+        # the library cache is also used when writing to standard output
+        library_paths = (
+            VMTranslator._get_input_paths(library) if library else []
+        )
+        self._library_paths = (
+            [library_paths] if isinstance(library_paths, Path)
+            else library_paths
+        )
+        self._library_cache = cache
 
     def translate(self: Self) -> None:
-        code = CodeWriter(self._output_path)
+        if self._cache:
+            input_paths = self._input_path
+            if isinstance(input_paths, Path):
+                input_paths = [input_paths]
+            key = self._cache.get_key(
+                [*input_paths, *self._library_paths], *self._get_options()
+            )
+            if self._cache.restore(key, self._get_output_paths()):
+                return
+
+        self._translate_all()
+
+        if self._cache:
+            self._cache.store(key, self._get_output_paths())
+
+    def _translate_all(self: Self) -> None:
+        if self._is_streamed():
+            self._translate_stream()
+            return
+
+        files = self._read_files()
+        library = self._load_library(files) if self._library_paths else None
+
+        # inlining first, so that pruning and linking drop what is no
+        # longer called
+        if self._inline:
+            files = self._inline_files(files, library)
+
+        if self._prune:
+            files = self._prune_files(files, library)
+
+        fragments = self._translate_files(files)
+        if library:
+            fragments += self._link_library(files, library)
+
+        output = self._create_machine_writer() if self._hack else None
+        code = CodeWriter(
+            output or self._output_path,
+            *self._get_writer_options(),
+            bootstrap=self._bootstrap
+        )
+        for fragment in fragments:
+            code.write_fragment(*fragment)
+        code.write_end()
+        code.close()
+
+        if output:
+            output.close()
+
+    def _translate_stream(self: Self) -> None:
+        # without a whole-program mode, each command read from standard
+        # input is written as soon as it is parsed by a single writer
+        output = self._create_machine_writer() if self._hack else None
+        writer_options = self._get_writer_options()
+        code = CodeWriter(
+            output or self._output_path,
+            *writer_options,
+            bootstrap=self._bootstrap
+        )
+        print(f"Translating '{STDIN_NAME}'...", file=sys.stderr)
+
+        commands = Parser(self._input_path).read_commands()
+        if self._optimize:
+            # the unoptimized translation is only written to count
+            # instructions, both counts include the bootstrap and the
+            # shared routines
+            reference = CodeWriter(
+                Path(os.devnull), *writer_options, bootstrap=self._bootstrap
+            )
+            commands = PeepholeOptimizer(
+                VMTranslator._write_through(commands, reference)
+            ).stream()
+
+        VMTranslator._translate(commands, code, name_by_class=True)
+        code.write_end()
+        code.close()
+
+        if output:
+            output.close()
+
+        if self._optimize:
+            reference.write_end()
+            reference.close()
+            before = reference.get_instruction_count()
+            after = code.get_instruction_count()
+            print(
+                f"Optimized '{STDIN_NAME}': "
+                f"{before} -> {after} instructions ({after - before:+})",
+                file=sys.stderr
+            )
 
+    def _is_streamed(self: Self) -> bool:
+        return (
+            not isinstance(self._input_path, Path | list)
+            and not (self._inline or self._prune or self._library_paths)
+        )
+
+    def _create_machine_writer(self: Self) -> MachineWriter:
+        if isinstance(self._output_path, Path):
+            packed_path = (
+                self._output_path.with_suffix(".hackb") if self._packed
+                else None
+            )
+            return MachineWriter(self._output_path, packed_path)
+
+        # only the packed words are written to standard output
+        if self._packed:
+            return MachineWriter(None, self._output_path.buffer)
+        return MachineWriter(self._output_path)
+
+    def _get_output_paths(self: Self) -> list[Path]:
+        if self._packed:
+            return [self._output_path, self._output_path.with_suffix(".hackb")]
+        return [self._output_path]
+
+    def _get_writer_options(
+        self: Self
+    ) -> tuple[bool, bool, bool, bool, bool]:
+        # the fragments of machine code are written without comments, so
+        # that they hold nothing but instructions
+        return (
+            self._shared_calls,
+            self._shared_comparisons,
+            self._fuse_comparisons,
+            self._cache_top,
+            not self._hack
+        )
+
+    def _translate_files(
+        self: Self,
+        files: list[tuple[str | None, list[Command]]],
+        report: bool = True
+    ) -> list[tuple[str, set[int], set[str]]]:
+        # every file is translated into its own fragment with file scoped
+        # labels, so the output does not depend on the number of workers
+        writer_options = self._get_writer_options()
+        if self._jobs == 1 or len(files) < 2:
+            return [
+                _translate_fragment(
+                    name, commands, writer_options, self._optimize, report
+                )
+                for name, commands in files
+            ]
+
+        with ProcessPoolExecutor(self._jobs) as executor:
+            return list(executor.map(
+                _translate_fragment,
+                [name for name, _ in files],
+                [commands for _, commands in files],
+                repeat(writer_options),
+                repeat(self._optimize),
+                repeat(report)
+            ))
+
+    def _load_library(
+        self: Self, files: list[tuple[str | None, list[Command]]]
+    ) -> Library:
+        # the library is rebuilt only when its sources, the translator or
+        # the options its code depends on change
+        options = [
+            "library",
+            *map(str, self._get_writer_options()),
+            str(self._optimize)
+        ]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "library.json"
+            cache = self._library_cache
+            key = cache.get_key(self._library_paths, *options) if cache else ""
+
+            if cache and cache.restore(key, [path]):
+                library = Library.read(path)
+            else:
+                library = self._build_library()
+                if cache:
+                    library.write(path)
+                    cache.store(key, [path])
+
+        return library.exclude(
+            {name for name, _ in files if name is not None},
+            {
+                name
+                for _, commands in files
+                for name, _ in Linker.split_functions(commands)
+                if name is not None
+            }
+        )
+
+    def _build_library(self: Self) -> Library:
+        functions = [
+            (file_name, name, body)
+            for file_name, commands in VMTranslator._read_paths(
+                self._library_paths
+            )
+            for name, body in Linker.split_functions(commands)
+            if name is not None
+        ]
+        # the library is a prebuild, its functions are translated quietly
+        fragments = self._translate_files(
+            [(file_name, body) for file_name, _, body in functions],
+            report=False
+        )
+
+        return Library({
+            name: (
+                file_name,
+                *fragment,
+                [command[1] for command in body if command[0] == "call"],
+                body
+            )
+            for (file_name, name, body), fragment in zip(functions, fragments)
+        })
+
+    def _link_library(
+        self: Self,
+        files: list[tuple[str | None, list[Command]]],
+        library: Library
+    ) -> list[tuple[str, set[int], set[str]]]:
+        # the bootstrap calls Sys.init, the program calls the rest
+        roots = [Linker.ROOT] + [
+            command[1]
+            for _, commands in files
+            for command in commands
+            if command[0] == "call"
+        ]
+        reachable = Linker.get_reachable(library.get_calls(), roots)
+        fragments = library.get_fragments(reachable)
+
+        print(
+            f"Linked {len(fragments)} of {library.get_size()} library "
+            "functions",
+            file=sys.stderr
+        )
+
+        return fragments
+
+    def _read_files(self: Self) -> list[tuple[str | None, list[Command]]]:
         if isinstance(self._input_path, Path):
-            code.set_file_name(VMTranslator._get_file_name(self._input_path))
-            parser = Parser(self._input_path)
-            self._translate(parser, code)
+            return VMTranslator._read_paths([self._input_path])
+        if isinstance(self._input_path, list):
+            return VMTranslator._read_paths(self._input_path)
+
+        parser = Parser(self._input_path)
+        return [(None, list(parser.read_commands()))]
+
+    @staticmethod
+    def _read_paths(
+        paths: list[Path]
+    ) -> list[tuple[str | None, list[Command]]]:
+        files = []
+        for path in paths:
+            parser = Parser(path)
+            commands = list(parser.read_commands())
             parser.close()
-        else:
-            for path in self._input_path:
-                code.set_file_name(VMTranslator._get_file_name(path))
-                parser = Parser(path)
-                self._translate(parser, code)
-                parser.close()
+            files.append((VMTranslator._get_file_name(path), commands))
+        return files
 
-        code.write_end()
+    def _prune_files(
+        self: Self,
+        files: list[tuple[str | None, list[Command]]],
+        library: Library | None
+    ) -> list[tuple[str | None, list[Command]]]:
+        linker = Linker(files, library.get_calls() if library else None)
+        files = linker.link()
+
+        removed = linker.get_removed_functions()
+        total = 0
+        for name, commands in removed:
+            size = self._count_instructions(commands)
+            total += size
+            print(f"Removed '{name}' ({size} instructions)", file=sys.stderr)
+        print(
+            f"Removed {len(removed)} unreachable functions "
+            f"({total} instructions)",
+            file=sys.stderr
+        )
+
+        return files
+
+    def _inline_files(
+        self: Self,
+        files: list[tuple[str | None, list[Command]]],
+        library: Library | None
+    ) -> list[tuple[str | None, list[Command]]]:
+        inliner = Inliner(
+            files,
+            lambda commands: self._count_instructions(commands, plain=True),
+            self._count_instructions,
+            budget=self._inline_budget,
+            library=library.get_functions() if library else None
+        )
+        files = inliner.inline()
+
+        inlined = inliner.get_inlined()
+        for name, size, sites, saving in inlined:
+            print(
+                f"Inlined '{name}' ({size} commands) at {sites} call sites, "
+                f"{saving} cycles saved per call",
+                file=sys.stderr
+            )
+        print(
+            f"Inlined {len(inlined)} functions at "
+            f"{sum(sites for _, _, sites, _ in inlined)} call sites "
+            f"({inliner.get_growth():+} instructions)",
+            file=sys.stderr
+        )
+
+        return files
+
+    def _count_instructions(
+        self: Self, commands: list[Command], plain: bool = False
+    ) -> int:
+        # plain counts without shared routines, where straight-line code
+        # takes as many cycles as it has instructions
+        options = self._get_writer_options()
+        if plain:
+            options = (False,) * len(options)
+        code = CodeWriter(io.StringIO(), *options, bootstrap=False)
+        VMTranslator._translate(commands, code)
         code.close()
+        return code.get_instruction_count()
+
+    @staticmethod
+    def _write_through(
+        commands: Iterable[Command], code: CodeWriter
+    ) -> Iterator[Command]:
+        for command in commands:
+            _WRITERS[command[0]](code, command)
+            yield command
+
+    @staticmethod
+    def _translate(
+        commands: Iterable[Command],
+        code: CodeWriter,
+        name_by_class: bool = False
+    ) -> None:
+        file_name = None
 
-    def _translate(self: Self, parser: Parser, code: CodeWriter) -> None:
-        while parser.has_more_lines():
-            op = parser.get_op()
-
-            if parser.is_pushpop():
-                segment = parser.get_arg1()
-                index = parser.get_arg2()
-                code.write_pushpop(op, segment, index)
-            elif parser.is_arithmetic():
-                code.write_arithmetic(op)
-            elif parser.is_label():
-                label = parser.get_arg1()
-                code.write_label(label)
-            elif parser.is_goto():
-                label = parser.get_arg1()
-                code.write_goto(label)
-            elif parser.is_if():
-                label = parser.get_arg1()
-                code.write_if(label)
-            elif parser.is_function():
-                function_name = parser.get_arg1()
-                n_args = parser.get_arg2()
-                code.write_function(function_name, n_args)
-            elif parser.is_return():
-                code.write_return()
-            elif parser.is_call():
-                function_name = parser.get_arg1()
-                n_args = parser.get_arg2()
-                code.write_call(function_name, n_args)
+        for command in commands:
+            if name_by_class and command[0] == "function":
+                class_name = command[1].split(".")[0]
+                if class_name != file_name:
+                    file_name = class_name
+                    code.set_file_name(file_name)
+            _WRITERS[command[0]](code, command)
+
+    def _get_options(self: Self) -> list[str]:
+        options = []
+        if self._shared_calls:
+            options.append("shared-calls")
+        if self._shared_comparisons:
+            options.append("shared-comparisons")
+        if self._fuse_comparisons:
+            options.append("fuse-comparisons")
+        if self._cache_top:
+            options.append("cache-top")
+        if self._optimize:
+            options.append("optimize")
+        if self._prune:
+            options.append("prune")
+        if self._hack:
+            options.append("packed" if self._packed else "hack")
+        if self._inline:
+            options.append(f"inline={self._inline_budget}")
+        if self._library_paths:
+            options.append(f"library={len(self._library_paths)}")
+        if not self._bootstrap:
+            options.append("no-bootstrap")
+        return options
 
     @staticmethod
     def _get_file_name(path: Path) -> str:
@@ -68,19 +458,91 @@ class VMTranslator:
         if path.is_file():
             return path.resolve()
         else:
-            return [p.resolve() for p in path.glob("*.vm")]
+            return sorted(p.resolve() for p in path.glob("*.vm"))
 
     @staticmethod
-    def _get_output_path(path: Path) -> Path:
+    def _get_output_path(path: Path, suffix: str) -> Path:
         if path.is_file():
-            return path.with_suffix(".asm").resolve()
+            return path.with_suffix(suffix).resolve()
         name = VMTranslator._get_file_name(path)
-        return (path / name).with_suffix(".asm").resolve()
+        return (path / name).with_suffix(suffix).resolve()
+
+def _translate_fragment(
+    name: str | None,
+    commands: list[Command],
+    writer_options: tuple[bool, bool, bool, bool, bool],
+    optimize: bool,
+    report: bool = True
+) -> tuple[str, set[int], set[str]]:
+    stream = io.StringIO()
+    code = CodeWriter(stream, *writer_options, bootstrap=False)
+
+    if name is None:
+        # a stream has no file names, so static variables are named
+        # after the class of the function they are used in instead
+        name = STDIN_NAME
+        name_by_class = True
+    else:
+        code.set_file_name(name)
+        name_by_class = False
+
+    if report:
+        print(f"Translating '{name}'...", file=sys.stderr)
+
+    if optimize:
+        # the unoptimized translation is only written to count instructions
+        reference = CodeWriter(io.StringIO(), *writer_options, bootstrap=False)
+        VMTranslator._translate(commands, reference)
+        reference.close()
+        commands = PeepholeOptimizer(commands).optimize()
+
+    VMTranslator._translate(commands, code, name_by_class)
+    code.close()
+
+    if optimize and report:
+        before = reference.get_instruction_count()
+        after = code.get_instruction_count()
+        print(
+            f"Optimized '{name}': "
+            f"{before} -> {after} instructions ({after - before:+})",
+            file=sys.stderr
+        )
+
+    return stream.getvalue(), *code.get_shared_routines()
+
+STDIN = Path("-")
+STDIN_NAME = "<stdin>"
+
+# opcode -> CodeWriter call for the command
+_WRITERS: dict[str, Callable[[CodeWriter, Command], None]] = {
+    **{
+        op: lambda code, command: code.write_arithmetic(command[0])
+        for op in ARITHMETIC_OPS
+    },
+    "push": lambda code, command: code.write_pushpop(*command),
+    "pop": lambda code, command: code.write_pushpop(*command),
+    "label": lambda code, command: code.write_label(command[1]),
+    "goto": lambda code, command: code.write_goto(command[1]),
+    "if-goto": lambda code, command: code.write_if(command[1]),
+    "function": lambda code, command: code.write_function(*command[1:]),
+    "call": lambda code, command: code.write_call(*command[1:]),
+    "return": lambda code, command: code.write_return(),
+    "move": lambda code, command: code.write_move(*command[1:]),
+    "push-arithmetic": lambda code, command: code.write_push_arithmetic(
+        *command[1:]
+    ),
+    "push-constant": lambda code, command: code.write_push_constant(
+        command[1]
+    )
+}
 
 def validate_path(path_str: str) -> Path:
     path_suffix = ".vm"
     path = Path(path_str)
 
+    if path == STDIN:
+        return path
+
     if not path.exists():
         raise argparse.ArgumentTypeError(f"file '{path}' does not exist")
     if path.is_file() and path.suffix != path_suffix:
@@ -90,13 +552,142 @@ def validate_path(path_str: str) -> Path:
 
     return path
 
+def validate_jobs(jobs_str: str) -> int:
+    jobs = int(jobs_str)
+    if jobs < 1:
+        raise argparse.ArgumentTypeError(
+            f"expected at least 1 job, got {jobs}"
+        )
+    return jobs
+
 def main():
     parser = argparse.ArgumentParser(
         description="Translate VM code to Hack assembly."
     )
-    parser.add_argument("path", type=validate_path, help="Path to .vm file")
+    parser.add_argument(
+        "path",
+        type=validate_path,
+        help="Path to .vm file or directory, '-' to read from standard input "
+             "and write to standard output"
+    )
+    parser.add_argument(
+        "--stdout",
+        action="store_true",
+        help="write the assembly to standard output"
+    )
+    parser.add_argument(
+        "--inline",
+        action="store_true",
+        help="expand small leaf functions at their call sites and report "
+             "the inlined ones"
+    )
+    parser.add_argument(
+        "--inline-budget",
+        type=int,
+        default=2000,
+        metavar="N",
+        help="maximum number of instructions inlining may add "
+             "(default: 2000)"
+    )
+    parser.add_argument(
+        "--library",
+        type=validate_path,
+        metavar="PATH",
+        help="link the functions the program reaches from a prebuilt library "
+             "of the VM files in PATH (like tools/OS) instead of translating "
+             "them with the program, the library is rebuilt only when they "
+             "change"
+    )
+    parser.add_argument(
+        "--hack",
+        action="store_true",
+        help="write Hack machine code (.hack) instead of assembly"
+    )
+    parser.add_argument(
+        "--packed",
+        action="store_true",
+        help="like --hack, and also write a .hackb file of little-endian "
+             "16-bit words (only the packed words when writing to standard "
+             "output)"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=validate_jobs,
+        default=None,
+        help="number of worker processes (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always translate, even when a cached output is available"
+    )
+    parser.add_argument(
+        "--shared-calls",
+        action="store_true",
+        help="jump to shared call and return routines instead of inlining "
+             "the frame handling at every call site and return"
+    )
+    parser.add_argument(
+        "--shared-comparisons",
+        action="store_true",
+        help="jump to one shared routine per comparison operator instead of "
+             "inlining eq, lt and gt"
+    )
+    parser.add_argument(
+        "--fuse-comparisons",
+        action="store_true",
+        help="translate a comparison followed by if-goto (optionally with a "
+             "not in between) into a single conditional jump"
+    )
+    parser.add_argument(
+        "--cache-top",
+        action="store_true",
+        help="keep the top of the stack in the D register between "
+             "arithmetic commands instead of writing it back to memory"
+    )
+    parser.add_argument(
+        "-O",
+        "--optimize",
+        action="store_true",
+        help="fuse short sequences of VM commands, such as a push followed "
+             "by a pop, and report the saved instructions of every file"
+    )
+    parser.add_argument(
+        "--no-bootstrap",
+        action="store_true",
+        help="do not set up the stack and call Sys.init first, like the "
+             "tests of project 07 and the ones of project 08 without a "
+             "Sys.vm expect"
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="translate only the functions reachable from Sys.init and "
+             "report the removed ones"
+    )
     args = parser.parse_args()
-    VMTranslator(args.path).translate()
+    cache = (
+        None if args.no_cache
+        else Cache("vmtranslator", Path(__file__).parent)
+    )
+    VMTranslator(
+        args.path,
+        cache,
+        args.stdout,
+        args.shared_calls,
+        args.shared_comparisons,
+        args.fuse_comparisons,
+        args.optimize,
+        args.prune,
+        args.jobs,
+        args.hack,
+        args.packed,
+        args.inline,
+        args.inline_budget,
+        args.cache_top,
+        args.library,
+        not args.no_bootstrap
+    ).translate()
 
 if __name__ == "__main__":
     main()
@@ -1,27 +1,42 @@
 from pathlib import Path
-from typing import Self
+from typing import Iterator, Self, TextIO
 import re
+import sys
 
 class JackTokenizer:
+    KEYWORD = 0
+    SYMBOL = 1
+    IDENTIFIER = 2
+    INT_CONST = 3
+    STRING_CONST = 4
+    # characters of whole lines tokenized at a time
+    CHUNK_SIZE = 1 << 14
+
     def __init__(self: Self, path: Path) -> None:
-        self._tokens = JackTokenizer._tokenize(path)
+        # the source is tokenized a chunk at a time as the tokens are
+        # needed, so the buffer never holds more than one chunk of tokens
+        self._chunks = JackTokenizer._tokenize(path)
+        self._buffer: list[tuple[int, str]] = []
         self._index = -1
 
     def has_more_tokens(self: Self) -> bool:
-        return self._index + 1 < len(self._tokens)
+        return self._index + 1 < len(self._buffer) or self._fill()
 
     def advance(self: Self) -> None:
+        # moving past the last token is fine as long as it is not read
+        if self._index + 1 == len(self._buffer):
+            self._fill()
         self._index += 1
 
     def token_type(self: Self) -> str:
-        return self._get_token()
+        return _TOKEN_TYPES[self._get_token()]
 
     def keyword(self: Self) -> str:
         return self._get_value()
 
     def symbol(self: Self) -> str:
         return self._get_value()
-    
+
     def identifier(self: Self) -> str:
         return self._get_value()
 
@@ -31,39 +46,95 @@ class JackTokenizer:
     def string_val(self: Self) -> str:
         return self._get_value()[1:-1]
 
-    def _get_token(self: Self) -> str:
-        return self._tokens[self._index][0]
+    def _fill(self: Self) -> bool:
+        # drops the tokens before the current one and reads chunks until
+        # there is a token after it
+        dropped = max(self._index, 0)
+        del self._buffer[:dropped]
+        self._index -= dropped
+
+        while self._index + 1 == len(self._buffer):
+            tokens = next(self._chunks, None)
+            if tokens is None:
+                return False
+            self._buffer += tokens
+
+        return True
+
+    def _get_token(self: Self) -> int:
+        return self._buffer[self._index][0]
 
     def _get_value(self: Self) -> str:
-        return self._tokens[self._index][1]
+        return self._buffer[self._index][1]
 
     @staticmethod
-    def _tokenize(path: Path) -> list[tuple[str, str]]:
-        keywords = {
-            "class", "constructor", "function", "method", "field",
-            "static", "var", "int", "char", "boolean", "void", "true",
-            "false", "null", "this", "let", "do", "if", "else",
-            "while", "return"
-        }
-        token_specification = [
-            ("COMMENT", r"/\*(?s:.*?)\*/|//.+\n"),
-            ("STRING_CONST", r"\".*\""),
-            ("IDENTIFIER", r"[_A-Za-z][_A-Za-z0-9]*"),
-            ("INT_CONST", r"\d+"),
-            ("SYMBOL", r"\S")
-        ]
-        token_regex = "|".join(f"(?P<{n}>{p})" for n, p in token_specification)
-        tokens = []
-
+    def _tokenize(path: Path) -> Iterator[list[tuple[int, str]]]:
         with open(path) as stream:
-            code = stream.read()
-            for mo in re.finditer(token_regex, code):
-                kind = mo.lastgroup
+            yield from JackTokenizer._tokenize_chunks(stream)
+
+    @staticmethod
+    def _tokenize_chunks(stream: TextIO) -> Iterator[list[tuple[int, str]]]:
+        # only a block comment can span lines, and a chunk is made of whole
+        # lines, so all that is carried over to the next chunk is whether
+        # it ends inside one
+        in_comment = False
+
+        while lines := stream.readlines(JackTokenizer.CHUNK_SIZE):
+            chunk = "".join(lines)
+            start = 0
+            tokens = []
+
+            if in_comment:
+                end = chunk.find("*/")
+                if end == -1:
+                    continue
+                start = end + 2
+                in_comment = False
+
+            for mo in _TOKEN_REGEX.finditer(chunk, start):
+                kind = _GROUP_KINDS[mo.lastindex]
+
+                if kind is None:
+                    if mo.lastgroup == "OPEN_COMMENT":
+                        in_comment = True
+                        break
+                    continue
+
                 value = mo.group()
+                if kind == JackTokenizer.IDENTIFIER:
+                    value = sys.intern(value)
+                    if value in _KEYWORDS:
+                        kind = JackTokenizer.KEYWORD
+                tokens.append((kind, value))
+
+            yield tokens
+
+        if in_comment:
+            raise ValueError("block comment not closed at the end of the file")
+
+_KEYWORDS = {
+    "class", "constructor", "function", "method", "field",
+    "static", "var", "int", "char", "boolean", "void", "true",
+    "false", "null", "this", "let", "do", "if", "else",
+    "while", "return"
+}
+
+_TOKEN_TYPES = [
+    "KEYWORD", "SYMBOL", "IDENTIFIER", "INT_CONST", "STRING_CONST"
+]
 
-                if kind == "IDENTIFIER" and value in keywords:
-                    tokens.append(("KEYWORD", value))
-                elif kind != "COMMENT":
-                    tokens.append((kind, value))
+_TOKEN_SPECIFICATION = [
+    ("COMMENT", r"/\*(?s:.*?)\*/|//.*", None),
+    ("OPEN_COMMENT", r"/\*", None),
+    ("STRING_CONST", r"\"[^\"\n]*\"", JackTokenizer.STRING_CONST),
+    ("IDENTIFIER", r"[_A-Za-z][_A-Za-z0-9]*", JackTokenizer.IDENTIFIER),
+    ("INT_CONST", r"\d+", JackTokenizer.INT_CONST),
+    ("SYMBOL", r"\S", JackTokenizer.SYMBOL)
+]
 
-        return tokens
+# compiled once, group n of a match is the kind _GROUP_KINDS[n]
+_TOKEN_REGEX = re.compile(
+    "|".join(f"(?P<{name}>{pattern})"
+             for name, pattern, _ in _TOKEN_SPECIFICATION)
+)
+_GROUP_KINDS = [None] + [kind for _, _, kind in _TOKEN_SPECIFICATION]
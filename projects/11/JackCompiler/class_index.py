@@ -0,0 +1,107 @@
+import json
+import os
+from hashlib import sha256
+from pathlib import Path
+from typing import Self
+from compilation_engine import Call, Signature
+
+# (source digest, output digest, subroutine signatures, calls) of a class,
+# the output digest being empty when the code is not written to a file
+Entry = tuple[str, str, dict[str, Signature], list[Call]]
+
+class ClassIndex:
+    # the classes of a directory as of its last build, so that a rebuild
+    # compiles only the classes whose source or output changed, with the
+    # subroutines each class declares and calls to check the calls of the
+    # classes that are not compiled again
+    def __init__(self: Self, entries: dict[str, Entry]) -> None:
+        self._entries = entries
+
+    @staticmethod
+    def read(path: Path) -> "ClassIndex":
+        if not path.is_file():
+            return ClassIndex({})
+
+        entries = json.loads(path.read_text())
+        return ClassIndex({
+            name: (
+                source,
+                output,
+                {fname: tuple(sig) for fname, sig in signatures.items()},
+                [tuple(call) for call in calls]
+            )
+            for name, (source, output, signatures, calls) in entries.items()
+        })
+
+    def write(self: Self, path: Path) -> None:
+        # written next to the index and renamed, so that a build running
+        # at the same time never reads half of it
+        path.parent.mkdir(parents=True, exist_ok=True)
+        staging = path.with_name(f"{path.name}.{os.getpid()}")
+        staging.write_text(json.dumps(self._entries))
+        staging.replace(path)
+
+    def is_current(self: Self, path: Path, output_path: Path) -> bool:
+        entry = self._entries.get(path.stem)
+        return (
+            entry is not None
+            and output_path.is_file()
+            and entry[0] == ClassIndex._get_digest(path)
+            and entry[1] == ClassIndex._get_digest(output_path)
+        )
+
+    def update(
+        self: Self,
+        path: Path,
+        output_path: Path | None,
+        signatures: dict[str, Signature],
+        calls: set[Call]
+    ) -> None:
+        self._entries[path.stem] = (
+            ClassIndex._get_digest(path),
+            ClassIndex._get_digest(output_path) if output_path else "",
+            signatures,
+            sorted(calls)
+        )
+
+    def remove(self: Self, name: str) -> None:
+        self._entries.pop(name, None)
+
+    def retain(self: Self, names: set[str]) -> None:
+        # drops the classes that are gone
+        self._entries = {
+            name: entry for name, entry in self._entries.items()
+            if name in names
+        }
+
+    def check_calls(self: Self) -> list[tuple[str, str]]:
+        # returns (class name, message) of the calls that do not match a
+        # subroutine of the directory, calls into other classes (like the
+        # OS) are not checked
+        warnings = []
+
+        for name, (_, _, _, calls) in sorted(self._entries.items()):
+            for cname, fname, kind, n in calls:
+                if cname not in self._entries:
+                    continue
+
+                signature = self._entries[cname][2].get(fname)
+                if signature is None:
+                    warnings.append(
+                        (name, f"{cname}.{fname} is not declared")
+                    )
+                    continue
+
+                fkind, m = signature
+                if (kind == "method") != (fkind == "method") or n != m:
+                    warnings.append((
+                        name,
+                        f"{cname}.{fname} is a {fkind} of {m} arguments, "
+                        f"called as a {kind} with {n}"
+                    ))
+
+        return warnings
+
+    @staticmethod
+    def _get_digest(path: Path) -> str:
+        return sha256(path.read_bytes()).hexdigest()
@@ -1,9 +1,15 @@
-from typing import Self
+from typing import Self, TextIO
 from pathlib import Path
 from jack_tokenizer import JackTokenizer
 from symbol_table import SymbolTable
 from vmwriter import VMWriter
 
+# (kind, number of arguments) of a subroutine
+Signature = tuple[str, int]
+# (class name, subroutine name, 'function' or 'method', number of
+# arguments) of a call, a constructor being called as a function
+Call = tuple[str, str, str, int]
+
 class CompilationEngine:
     _SEGMENTS = {
         "static": "static",
@@ -12,19 +18,29 @@ class CompilationEngine:
         "arg": "argument"
     }
 
-    def __init__(self: Self, input_path: Path, output_path: Path):
+    def __init__(
+        self: Self, input_path: Path | TextIO, output_path: Path | TextIO
+    ):
         self._token = JackTokenizer(input_path)
         self._writer = VMWriter(output_path)
         self._class_table = SymbolTable()
         self._function_table = SymbolTable()
         self._class_name = ""
         self._label_count = 0
+        self._signatures: dict[str, Signature] = {}
+        self._calls: set[Call] = set()
 
     def compile(self: Self) -> None:
         self._token.next()
         self._compile_class()
         self._writer.close()
 
+    def get_signatures(self: Self) -> dict[str, Signature]:
+        return self._signatures
+
+    def get_calls(self: Self) -> set[Call]:
+        return self._calls
+
     def _compile_class(self: Self) -> None:
         ### 'class' className '{' classVarDec* subroutineDec* '}'
         ###    1        2      3       4             5         6
@@ -108,6 +124,12 @@ class CompilationEngine:
         self._token.next()              # 4 (
         self._compile_parameter_list()  # 5 parameterList
         self._token.next()              # 6 )
+
+        n = self._function_table.var_count("arg")
+        if ftype == "method":
+            n -= 1
+        self._signatures[fname] = (ftype, n)
+
         self._compile_subroutine_body(ftype, fname) # 7 subroutineBody
 
     def _compile_parameter_list(self: Self) -> None:
@@ -447,6 +469,7 @@ class CompilationEngine:
         self._token.next()                   # 4 )
 
         self._writer.write_call(f"{self._class_name}.{fname}", n + 1)
+        self._calls.add((self._class_name, fname, "method", n))
 
     def _is_class_function_call(self: Self) -> bool:
         vname = self._token.identifier()
@@ -474,6 +497,7 @@ class CompilationEngine:
         self._token.next()                   # 6 )
 
         self._writer.write_call(f"{cname}.{fname}", n)
+        self._calls.add((cname, fname, "function", n))
 
     def _is_method_call(self: Self) -> bool:
         vname = self._token.identifier()
@@ -513,6 +537,7 @@ class CompilationEngine:
         self._token.next()                   # 6 )
 
         self._writer.write_call(f"{cname}.{fname}", n + 1)
+        self._calls.add((cname, fname, "method", n))
 
     def _compile_var_name(self: Self) -> None:
         vname = self._token.identifier()
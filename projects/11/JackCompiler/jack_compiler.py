@@ -1,40 +1,170 @@
 #!/usr/bin/env python
 
 import argparse
+import io
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Self
-from compilation_engine import CompilationEngine
+from typing import Self, TextIO
+# modules shared by the toolchain, like the cache, live in projects/common
+sys.path.append(str(Path(__file__).resolve().parents[2] / "common"))
+from compilation_engine import Call, CompilationEngine, Signature
+from class_index import ClassIndex
+from toolcache import Cache
 
 class JackCompiler:
-    def __init__(self: Self, path: Path) -> None:
-        self._input_path = JackCompiler._get_input_path(path)
+    def __init__(
+        self: Self,
+        path: Path,
+        cache: Cache | None = None,
+        stdout: bool = False,
+        jobs: int | None = None
+    ) -> None:
+        self._input_path: Path | list[Path] | TextIO
+        if path == STDIN:
+            self._input_path = sys.stdin
+            stdout = True
+        else:
+            self._input_path = JackCompiler._get_input_path(path)
+        self._stdout = stdout
+        self._cache = None if stdout else cache
+        self._jobs = jobs
+        # the classes of a directory are tracked by an index in the cache
+        self._index_path = (
+            JackCompiler._get_index_path(self._cache, path.resolve())
+            if self._cache and isinstance(self._input_path, list)
+            else None
+        )
 
-    def compile(self: Self) -> None:
+    def compile(self: Self) -> int:
+        # returns the number of classes that failed to compile
         input_path = self._input_path
-        if isinstance(input_path, Path):
-            output_path = self._get_output_path(input_path)
-            CompilationEngine(input_path, output_path).compile()
+        if isinstance(input_path, list):
+            return self._compile_all(input_path)
+
+        if self._stdout:
+            CompilationEngine(input_path, sys.stdout).compile()
         else:
-            for path in input_path:
-                output_path = self._get_output_path(path)
-                CompilationEngine(path, output_path).compile()
+            JackCompiler._compile(input_path, self._cache)
+        return 0
+
+    def _compile_all(self: Self, paths: list[Path]) -> int:
+        # only the classes that changed since the last build are compiled,
+        # they compile independently so in parallel, and a class that fails
+        # does not stop the others, the code and the errors are then
+        # written in file order
+        index = (
+            ClassIndex.read(self._index_path) if self._index_path
+            else ClassIndex({})
+        )
+        changed = [
+            path for path in paths
+            if not index.is_current(path, JackCompiler._get_output_path(path))
+        ]
+
+        args = (changed, repeat(self._stdout))
+        if self._jobs == 1 or len(changed) < 2:
+            results = list(map(_compile_file, *args))
+        else:
+            with ProcessPoolExecutor(self._jobs) as executor:
+                results = list(executor.map(_compile_file, *args))
+
+        failures = 0
+        index.retain({path.stem for path in paths})
+
+        for path, (code, error, signatures, calls) in zip(changed, results):
+            if error is not None:
+                failures += 1
+                print(f"{path}: error: {error}", file=sys.stderr)
+                # so that it is compiled again by the next build
+                index.remove(path.stem)
+                continue
+
+            sys.stdout.write(code)
+            output_path = (
+                None if self._stdout else JackCompiler._get_output_path(path)
+            )
+            index.update(path, output_path, signatures, calls)
+
+        # the code of a call does not depend on the subroutine it calls, so
+        # a class is not compiled again when a class it calls changes, the
+        # calls of all classes are checked against the index instead
+        directory = paths[0].parent if paths else Path()
+        for name, message in index.check_calls():
+            print(
+                f"{directory / name}.jack: warning: {message}",
+                file=sys.stderr
+            )
+
+        if self._index_path:
+            index.write(self._index_path)
+            print(
+                f"Compiled {len(changed) - failures} of {len(paths)} classes, "
+                f"{failures} failed",
+                file=sys.stderr
+            )
+
+        return failures
+
+    @staticmethod
+    def _compile(path: Path, cache: Cache | None) -> None:
+        output_path = JackCompiler._get_output_path(path)
+
+        if cache:
+            key = cache.get_key([path])
+            if cache.restore(key, [output_path]):
+                return
+
+        CompilationEngine(path, output_path).compile()
+
+        if cache:
+            cache.store(key, [output_path])
+
+    @staticmethod
+    def _get_index_path(cache: Cache, directory: Path) -> Path:
+        # unlike a cache entry, the index of a directory is updated in
+        # place, there is one per directory and version of the compiler
+        key = cache.get_key([], "index", str(directory))
+        return cache.get_directory() / "index" / f"{key}.json"
 
     @staticmethod
     def _get_input_path(path: Path) -> Path | list[Path]:
         if path.is_file():
             return path.resolve()
-        return [p.resolve() for p in path.glob("*.jack")]
+        return sorted(p.resolve() for p in path.glob("*.jack"))
 
     @staticmethod
     def _get_output_path(path: Path) -> Path:
         return path.with_suffix(".vm")
 
+def _compile_file(
+    path: Path, stdout: bool
+) -> tuple[str, str | None, dict[str, Signature], set[Call]]:
+    # returns the code when it goes to standard output, and the error of a
+    # class that fails instead of raising it, so that all of them are
+    # reported
+    try:
+        stream = io.StringIO()
+        output_path = JackCompiler._get_output_path(path)
+        engine = CompilationEngine(path, stream if stdout else output_path)
+        engine.compile()
+        signatures = engine.get_signatures()
+        return stream.getvalue(), None, signatures, engine.get_calls()
+    except Exception as e:
+        return "", f"{type(e).__name__}: {e}", {}, set()
+
 
 
+STDIN = Path("-")
+
 def validate_path(path_str: str) -> Path:
     SUFFIX = ".jack"
     path = Path(path_str)
 
+    if path == STDIN:
+        return path
+
     if not path.exists():
         raise argparse.ArgumentTypeError(f"file '{path}' does not exist")
     if path.is_file() and path.suffix != SUFFIX:
@@ -44,15 +174,48 @@ def validate_path(path_str: str) -> Path:
 
     return path
 
+def validate_jobs(jobs_str: str) -> int:
+    jobs = int(jobs_str)
+    if jobs < 1:
+        raise argparse.ArgumentTypeError(
+            f"expected at least 1 job, got {jobs}"
+        )
+    return jobs
+
 def main():
     parser = argparse.ArgumentParser(
         description="Translate .jack code to token list in .xml format."
     )
     parser.add_argument(
-        "path", type=validate_path, help="path to .jack file or directory"
+        "path",
+        type=validate_path,
+        help="path to .jack file or directory, '-' to read from standard "
+             "input and write to standard output"
+    )
+    parser.add_argument(
+        "--stdout",
+        action="store_true",
+        help="write the VM code of all classes to standard output"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=validate_jobs,
+        default=None,
+        help="number of worker processes when compiling a directory "
+             "(default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always compile, even when a cached output is available"
     )
     args = parser.parse_args()
-    JackCompiler(args.path).compile()
+    cache = (
+        None if args.no_cache
+        else Cache("jackcompiler", Path(__file__).parent)
+    )
+    if JackCompiler(args.path, cache, args.stdout, args.jobs).compile():
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,16 @@
 from pathlib import Path
-from typing import Self
+from typing import Self, TextIO
 
 class VMWriter:
-    def __init__(self: Self, path: Path) -> None:
-        self._stream = open(path, "w")
+    def __init__(self: Self, path: Path | TextIO) -> None:
+        self._owns_stream = isinstance(path, Path)
+        self._stream = open(path, "w") if isinstance(path, Path) else path
 
     def close(self: Self) -> None:
-        self._stream.close()
+        if self._owns_stream:
+            self._stream.close()
+        else:
+            self._stream.flush()
 
     def write_push(self: Self, segment: str, index: int) -> None:
         self._writeline(f"push {segment} {index}")
@@ -0,0 +1,103 @@
+from itertools import permutations
+
+# the encoding of Hack instructions, shared by the assembler and the
+# machine code backend of the VM translator, which add this directory to
+# sys.path to import it
+
+# (dest, comp, jump) of a C-instruction, without the empty parts
+Computation = tuple[str | None, str, str | None]
+
+def code_computation(dest: str | None, comp: str, jump: str | None) -> int:
+    return _COMPUTATION_MAP[(dest or None, comp, jump or None)]
+
+def code_instruction(line: str) -> int:
+    # a C-instruction as written by the VM translator, dest=comp;jump
+    # without spaces
+    return _INSTRUCTION_MAP[line]
+
+PREDEFINED_SYMBOLS = {
+    **{f"R{i}": i for i in range(16)},
+    "SP": 0,
+    "LCL": 1,
+    "ARG": 2,
+    "THIS": 3,
+    "THAT": 4,
+    "SCREEN": 16384,
+    "KBD": 24576
+}
+
+COMP_MAP = {
+    "0": 0b0101010,
+    "1": 0b0111111,
+    "-1": 0b0111010,
+    "D": 0b0001100,
+    "A": 0b0110000,
+    "M": 0b1110000,
+    "!D": 0b0001101,
+    "!A": 0b0110001,
+    "!M": 0b1110001,
+    "-D": 0b0001111,
+    "-A": 0b0110011,
+    "-M": 0b1110011,
+    "D+1": 0b0011111,
+    "A+1": 0b0110111,
+    "M+1": 0b1110111,
+    "D-1": 0b0001110,
+    "A-1": 0b0110010,
+    "M-1": 0b1110010,
+    "D+A": 0b0000010,
+    "D+M": 0b1000010,
+    "D-A": 0b0010011,
+    "D-M": 0b1010011,
+    "A-D": 0b0000111,
+    "M-D": 0b1000111,
+    "D&A": 0b0000000,
+    "D&M": 0b1000000,
+    "D|A": 0b0010101,
+    "D|M": 0b1010101
+}
+
+JUMP_MAP = {
+    None: 0b000,
+    "JGT": 0b001,
+    "JEQ": 0b010,
+    "JGE": 0b011,
+    "JLT": 0b100,
+    "JNE": 0b101,
+    "JLE": 0b110,
+    "JMP": 0b111
+}
+
+def _create_dest_map() -> dict[str | None, int]:
+    dest_map = {None: 0b000}
+    for n in range(1, 4):
+        for registers in permutations("ADM", n):
+            A = int("A" in registers)
+            D = int("D" in registers)
+            M = int("M" in registers)
+            dest_map["".join(registers)] = A << 2 | D << 1 | M
+    return dest_map
+
+DEST_MAP = _create_dest_map()
+
+def _create_computation_map() -> dict[Computation, int]:
+    return {
+        (dest, comp, jump): 0b111 << 13 | compb << 6 | destb << 3 | jumpb
+        for dest, destb in DEST_MAP.items()
+        for comp, compb in COMP_MAP.items()
+        for jump, jumpb in JUMP_MAP.items()
+    }
+
+def _create_instruction_map() -> dict[str, int]:
+    instruction_map = {}
+    for (dest, comp, jump), word in _COMPUTATION_MAP.items():
+        line = f"{dest}={comp}" if dest else comp
+        line = f"{line};{jump}" if jump else line
+        instruction_map[line] = word
+    return instruction_map
+
+# every normalized dest=comp;jump form mapped to its 16-bit instruction word
+_COMPUTATION_MAP = _create_computation_map()
+
+# the same words keyed by the text of the instruction
+_INSTRUCTION_MAP = _create_instruction_map()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+from hashlib import sha256
+from pathlib import Path
+from typing import Self
+
+# the cache of the assembler, the VM translator and the Jack compiler,
+# which add this directory to sys.path to import it
+class Cache:
+    def __init__(
+        self: Self, tool: str, sources: Path, directory: Path | None = None
+    ) -> None:
+        directory = directory or Cache._get_default_directory()
+        self._directory = directory / tool
+        self._tool = tool
+        self._version = Cache._get_tool_version(sources)
+
+    def get_key(self: Self, input_paths: list[Path], *options: str) -> str:
+        digest = sha256()
+
+        for part in [self._tool, self._version, *options]:
+            digest.update(part.encode() + b"\0")
+
+        # names are part of the key since they end up in the output
+        # (static variables, output file names) and their order matters
+        for path in input_paths:
+            digest.update(path.name.encode() + b"\0")
+            digest.update(sha256(path.read_bytes()).digest())
+
+        return digest.hexdigest()
+
+    def restore(self: Self, key: str, output_paths: list[Path]) -> bool:
+        entry = self._directory / key
+        cached_paths = [entry / path.name for path in output_paths]
+
+        if not all(path.is_file() for path in cached_paths):
+            return False
+
+        for cached_path, output_path in zip(cached_paths, output_paths):
+            shutil.copyfile(cached_path, output_path)
+
+        return True
+
+    def store(self: Self, key: str, output_paths: list[Path]) -> None:
+        self._directory.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=self._directory))
+
+        for path in output_paths:
+            shutil.copyfile(path, staging / path.name)
+
+        try:
+            staging.rename(self._directory / key)
+        except OSError:
+            # another process has stored the same entry in the meantime
+            shutil.rmtree(staging)
+
+    def get_directory(self: Self) -> Path:
+        return self._directory
+
+    @staticmethod
+    def _get_default_directory() -> Path:
+        if "NAND2TETRIS_CACHE" in os.environ:
+            return Path(os.environ["NAND2TETRIS_CACHE"])
+        xdg_cache = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+        return Path(xdg_cache) / "nand2tetris"
+
+    @staticmethod
+    def _get_tool_version(sources: Path) -> str:
+        # any change to the tool's sources (the directory of its script) or
+        # to the modules shared in this directory invalidates its cached
+        # outputs
+        paths = {path.resolve() for path in sources.glob("*.py")}
+        paths |= {
+            path.resolve() for path in Path(__file__).parent.glob("*.py")
+        }
+
+        digest = sha256()
+        for path in sorted(paths):
+            digest.update(path.read_bytes())
+        return digest.hexdigest()